@@ -22,60 +22,209 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ###############################################################################
+import weakref
 import numpy as np
-from scipy.stats import rv_discrete
 from math import ceil
-from time import time
 from docopt import docopt
-from helpers import gen_matrix, usage, schema
+from helpers import kernel, time_kernel, metrics, report, gen_matrix, load_tuning,\
+    usage, schema
 from schema import SchemaError
 
+# The fraction of the norm-based probabilities mixed with the uniform probabilities
+# for each approximation method, the tuned method uses the fraction found by the
+# evolutionary strategy search
+MIX = {'uniform': 0.0, 'non-uniform': 1.0}
+
+# The column and row norms of the last matrices A and B, reused by the sampling
+# and error bound of a product, which only hold weak references to the matrices
+# so that they are not kept in memory after the product
+_norms = {}
+
+
+def norm_products(A, B):
+    """Returns the product of the euclidean norms of each column of A and the
+    corresponding row of B. The norms are cached for the last matrices A and B,
+    which must not be modified until the cache is cleared.
+    """
+    if 'A' not in _norms or _norms['A']() is not A or _norms['B']() is not B:
+        _norms.clear()
+        _norms.update(A=weakref.ref(A), B=weakref.ref(B),
+                      weights=np.linalg.norm(A, axis=0) * np.linalg.norm(B, axis=1))
+    return _norms['weights']
+
+
+def sampling_probs(A, B):
+    """Returns the probability of sampling each column of A and corresponding row
+    of B, proportional to the product of their euclidean norms as proposed by
+    Drineas and Kannan.
+    """
+    weights = norm_products(A, B)
+
+    # The product of matrices without any non-zero column and row pair is zero,
+    # which is estimated exactly by any distribution
+    total = weights.sum()
+    if not np.isfinite(total):
+        raise ValueError('The norms of the columns of A and rows of B are not finite.')
+    if total == 0:
+        return np.full(weights.shape, 1.0 / weights.size)
+
+    probs = weights / total
+    if not np.isclose(probs.sum(), 1.0):
+        raise ValueError('The sampling probabilities do not sum to 1.')
+    return probs
+
+
+def sample(A, B, S, R, probs, idx, samples=None):
+    """Fills S and R with the sampled columns of A and rows of B, scaled so that
+    the product S*R is an unbiased estimate of the product A*B for the number of
+    samples, by default the number of columns of S.
+    """
+    samples = S.shape[1] if samples is None else samples
+    scaling = np.sqrt(samples * probs[idx])
+    np.divide(A[:, idx], scaling, out=S)
+    np.divide(B[idx, :], scaling[:, np.newaxis], out=R)
+
 
 def uniform_approx(A, B, S, R):
     """Creates uniformly approximate matrices of A and B, C and R."""
-    # Pick rows from A and corresponding column from B uniformly random
+    # Pick columns from A and corresponding rows from B uniformly random, since
+    # uniform all columns and rows have equal probability
     n = A.shape[1]
     s = S.shape[1]
-    p_each = 1.0 / n  # Since uniform all row/col have equal probability
-    for t in range(0, s):
-        # Pick a random row and column independently with replacement
-        i_t = np.random.randint(0, n)
-        S[:, t] = A[i_t, :]
-        R[t, :] = B[:, i_t]
+    probs = np.full(n, 1.0 / n)
 
-    # Apply uniform scaling
-    scaling = np.sqrt(s * p_each)
-    S /= scaling
-    R /= scaling
+    # Pick the random columns and rows independently with replacement
+    sample(A, B, S, R, probs, np.random.randint(0, n, size=s))
 
 
 def non_uniform_approx(A, B, S, R):
     """Creates non-uniformly approximate matrices of A and B, C and R."""
-    # Pick rows from A and corresponding column from B uniformly random
+    # Pick columns from A and corresponding rows from B with the probabilities
+    # based on the amount of information in each using the method proposed by
+    # Drineas and Kannan
     n = A.shape[1]
     s = S.shape[1]
-    rows = np.arange(0, n)  # The list of rows
-    probs = np.zeros(n)  # The probability of each column
-
-    # Calculate the probability of selecting each column based on the amount of
-    # information using the method proposed by Drineas and Kannan. The probability
-    # is based on the product of the row and column euclidean norms divided by
-    # the cumulative sum of the product of euclidean norms for all rows and columns
-    D = 0.0
-    for i in range(0, n):
-        prod = np.sqrt((A[i, :]*A[i, :]).sum()) * np.sqrt((B[:, i]*B[:, i]).sum())
-        D += prod
-        probs[i] = prod / D
-
-    # Use the probabilities to pick the rows and columns non-uniformly
-    distrib = rv_discrete(values=(rows, probs))
-    for t, i_t in enumerate(distrib.rvs(size=s)):
-        S[:, t] = A[i_t, :]
-        R[t, :] = B[:, i_t]
-        # Apply scaling
-        scaling = np.sqrt(s * probs[i_t])
-        S[:, t] /= scaling
-        R[t, :] /= scaling
+    probs = sampling_probs(A, B)
+    sample(A, B, S, R, probs, np.random.choice(n, size=s, p=probs))
+
+
+def method_probs(A, B, mix):
+    """Returns the sampling probabilities mixing the fraction of the norm-based
+    probabilities with the uniform probabilities.
+    """
+    uniform = np.full(A.shape[1], 1.0 / A.shape[1])
+    if mix == 0:
+        return uniform
+    return (1.0 - mix) * uniform + mix * sampling_probs(A, B)
+
+
+def mixed_approx(A, B, S, R, mix):
+    """Creates approximate matrices of A and B, C and R, sampled with the mixture
+    of the uniform and norm-based probabilities.
+    """
+    n = A.shape[1]
+    s = S.shape[1]
+    probs = method_probs(A, B, mix)
+    sample(A, B, S, R, probs, np.random.choice(n, size=s, p=probs))
+
+
+def error_bound(A, B, probs, samples, norm):
+    """Returns the estimated relative error of the approximate product for the
+    number of samples with the probabilities, given the squared Frobenius norm of
+    the approximate product. The expected squared error of the estimate is
+    (V - |AB|^2) / s where V is the sum of the squared norm products divided by
+    the probabilities, and |AB|^2 is estimated from the approximate product.
+    """
+    weights = norm_products(A, B)
+    nonzero = probs > 0
+    V = np.sum(weights[nonzero]**2 / probs[nonzero])
+    exact = (samples * norm - V) / (samples - 1) if samples > 1 else norm
+    variance = max(V - exact, 0.0) / samples
+    return np.sqrt(variance / exact) if exact > 0 else (0.0 if variance == 0 else np.inf)
+
+
+def incremental_approx(A, B, S, R, mix, target):
+    """Computes the approximate product with an increasing number of samples until
+    the estimated relative error is at most the target, or all of the columns of
+    S are used. The samples are doubled each step and the outer products of the
+    previous samples are reused, the number of samples and the estimated error
+    are recorded as metrics.
+    """
+    n, s_max = A.shape[1], S.shape[1]
+    probs = method_probs(A, B, mix)
+    total = np.zeros((A.shape[0], B.shape[1]))
+
+    samples, batch = 0, max(1, s_max // 8)
+    while True:
+        batch = min(batch, s_max - samples)
+        idx = np.random.choice(n, size=batch, p=probs)
+        S_t, R_t = S[:, :batch], R[:batch, :]
+
+        # Each sample is scaled as if it were the only sample, the sum of the outer
+        # products is divided by the number of samples for the estimate
+        sample(A, B, S_t, R_t, probs, idx, samples=1)
+        total += np.dot(S_t, R_t)
+        samples += batch
+
+        C = total / samples
+        bound = error_bound(A, B, probs, samples, np.vdot(C, C))
+        if bound <= target or samples == s_max:
+            break
+        batch = samples
+
+    metrics['samples'] = samples
+    metrics['bound'] = bound
+    return C
+
+
+def tuning_key(dtype, mtype, dim):
+    """Returns the key of the tuned parameters for the matrices."""
+    return '%s-%s-%d' % (dtype, mtype or 'dense', dim)
+
+
+def sample_count(dim, ratio):
+    """Returns the number of samples for the fraction of the dimension."""
+    return max(1, int(ceil(dim * ratio)))
+
+
+def setup(A, B, args):
+    """Creates the approximate matrices S and R with the number of samples given by
+    --samples, otherwise the fraction --ratio of the size of A and B. The tuned
+    method uses the mixture and ratio found by the evolutionary strategy search
+    for the matrices, or the non-uniform method if they have not been tuned.
+    """
+    dim = A.shape[1]
+    mix, ratio = MIX.get(args['--approx']), args['--ratio']
+    if args['--approx'] == 'tuned':
+        tuned = load_tuning('approx').get(
+            tuning_key(args['--dtype'], args['--mtype'], dim), {'mix': 1.0, 'ratio': ratio})
+        mix, ratio = tuned['mix'], tuned['ratio']
+    approx_dim = args['--samples'] if args['--samples'] is not None else sample_count(dim, ratio)
+    # The setup precedes each timed run, so the norms are computed by every run as
+    # they would be for new matrices, the same as the evolutionary strategy search
+    _norms.clear()
+    S = gen_matrix(A.shape[0], approx_dim, 'float', empty=True)
+    R = gen_matrix(approx_dim, B.shape[1], 'float', empty=True)
+    return A, B, S, R, mix, args['--target']
+
+
+@kernel(setup=setup)
+def approx(A, B, S, R, mix, target=None):
+    """Calculates the approximate matrices S and R sampled with the mixture of the
+    uniform and norm-based probabilities and computes the product S*R as the sum
+    of outer products, if a target relative error is given the samples are added
+    incrementally until it is met. The time includes computing the norms of the
+    norm-based probabilities.
+    """
+    if target is not None:
+        return incremental_approx(A, B, S, R, mix, target)
+    if mix == 0:
+        uniform_approx(A, B, S, R)
+    elif mix == 1:
+        non_uniform_approx(A, B, S, R)
+    else:
+        mixed_approx(A, B, S, R, mix)
+    return np.dot(S, R)
 
 
 if __name__ == '__main__':
@@ -85,24 +234,5 @@ if __name__ == '__main__':
     except SchemaError as e:
         exit(e)
 
-    dim, dtype, mtype, approx = args['DIM'], args['--dtype'], args['--mtype'], args['--approx']
-
-    # Generate the dynamic matrices for the test
-    A = gen_matrix(dim, dim, dtype, mtype)
-    B = gen_matrix(dim, dim, dtype, mtype)
-
-    # Make the approximate matrices S and R 75% of the size of A and B
-    approx_dim = int(ceil(dim * 0.75))
-    S = gen_matrix(dim, approx_dim, 'float', empty=True)
-    R = gen_matrix(approx_dim, dim, 'float', empty=True)
-
-    # Calculate the uniform approximate matrix and compute the product
-    # S*R as the sum of outer products
-    start = time()
-    if approx == 'uniform':
-        uniform_approx(A, B, S, R)
-    elif approx == 'non-uniform':
-        non_uniform_approx(A, B, S, R)
-    T = np.dot(S, R)
-    end = time()
-    print "%0.3f" % (end-start,)
+    # Calculate the execution time of the approximate multiplication
+    report(time_kernel(__name__, args))
@@ -22,11 +22,17 @@
 #
 ###############################################################################
 import numpy as np
-from time import time
 from docopt import docopt
-from helpers import gen_matrix, usage, schema
+from helpers import kernel, time_kernel, report, usage, schema
 from schema import SchemaError
 
+
+@kernel()
+def baseline(A, B):
+    """Computes the matrix multiplication using numpy's serial np.dot"""
+    return np.dot(A, B)
+
+
 if __name__ == '__main__':
     args = docopt(usage)
     try:
@@ -34,13 +40,5 @@ if __name__ == '__main__':
     except SchemaError as e:
         exit(e)
 
-    # Generate the dynamic matrices for the test
-    dim, dtype, mtype = args['DIM'], args['--dtype'], args['--mtype']
-    A = gen_matrix(dim, dim, dtype, mtype)
-    B = gen_matrix(dim, dim, dtype, mtype)
-
     # Calculate the execution time for the baseline
-    start = time()
-    C = np.dot(A, B)
-    end = time()
-    print "%0.3f" % (end-start,)
+    report(time_kernel(__name__, args))
@@ -0,0 +1,108 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Cache blocked (tiled) matrix multiplication, multiplies the matrices tile by
+# tile using NumPy on the sub-blocks, with the tile size autotuned for each
+# data type and dimension.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import numpy as np
+from docopt import docopt
+from helpers import clock, kernel, time_kernel, report, load_tuning, save_tuning,\
+    usage, schema
+from schema import SchemaError
+
+# The tile sizes evaluated by the autotuner
+TILES = [16, 32, 64, 128, 256, 512, 1024]
+
+# The maximum number of tile products for a tile size to be evaluated
+MAX_PRODUCTS = 2**17
+
+
+def tile_key(A, B):
+    """Returns the key of the tuned tile size for the matrices."""
+    return '%s-%dx%dx%d' % (np.result_type(A, B).name, A.shape[0], A.shape[1], B.shape[1])
+
+
+def autotune(A, B):
+    """Times the blocked multiplication of A and B for each of the tile sizes and
+    returns the fastest, the result is persisted for the data type and dimensions.
+    """
+    key = tile_key(A, B)
+    tuning = load_tuning('blocked')
+    if key in tuning:
+        return tuning[key]
+
+    # Only evaluate the tile sizes that fit the matrices and do not require too many
+    # tile products, as these can take far longer than the multiplication itself
+    products = lambda t: np.prod([-(-d // t) for d in A.shape + B.shape[1:]])
+    tiles = [t for t in TILES if t <= max(A.shape + B.shape) and products(t) <= MAX_PRODUCTS]
+
+    best, best_time = TILES[-1], None
+    for tile in tiles:
+        C = np.zeros((A.shape[0], B.shape[1]), dtype=np.result_type(A, B))
+        start = clock()
+        blocked(A, B, C, tile)
+        runtime = clock() - start
+        if best_time is None or runtime < best_time:
+            best, best_time = tile, runtime
+
+    save_tuning('blocked', key, best)
+    return best
+
+
+def setup(A, B, args):
+    """Creates the empty result matrix C and uses the tile size given by --tile,
+    otherwise the autotuned tile size.
+    """
+    tile = args['--tile'] if args['--tile'] is not None else autotune(A, B)
+    C = np.zeros((A.shape[0], B.shape[1]), dtype=np.result_type(A, B))
+    return A, B, C, tile
+
+
+@kernel(setup=setup)
+def blocked(A, B, C, tile):
+    """Computes the matrix multiplication tile by tile, the product of each pair of
+    tiles is computed into a scratch buffer and accumulated in-place into C.
+    """
+    m, n, p = A.shape[0], A.shape[1], B.shape[1]
+    scratch = {}
+    for i in range(0, m, tile):
+        for k in range(0, n, tile):
+            A_ik = A[i:i+tile, k:k+tile]
+            for j in range(0, p, tile):
+                B_kj = B[k:k+tile, j:j+tile]
+                shape = (A_ik.shape[0], B_kj.shape[1])
+                if shape not in scratch:
+                    scratch[shape] = np.empty(shape, dtype=C.dtype)
+                C_ij = C[i:i+tile, j:j+tile]
+                np.add(C_ij, np.dot(A_ik, B_kj, out=scratch[shape]), out=C_ij)
+    return C
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Calculate the execution time for the blocked approach
+    report(time_kernel(__name__, args))
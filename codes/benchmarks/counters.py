@@ -0,0 +1,200 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Measures the resources used by the timed region of the benchmark kernels,
+# the CPU time, peak resident memory, and the Linux perf_event hardware
+# counters where they are available.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import os
+import ctypes
+import platform
+import resource
+from fcntl import ioctl
+from collections import OrderedDict
+
+# The number of the perf_event_open system call for each architecture
+PERF_EVENT_OPEN = {'x86_64': 298, 'i686': 336, 'aarch64': 241, 'armv7l': 364, 'ppc64le': 319}
+
+# The generic hardware events counted, the type is PERF_TYPE_HARDWARE
+PERF_TYPE_HARDWARE = 0
+EVENTS = OrderedDict([('instructions', 1), ('cache_refs', 2), ('cache_misses', 3),
+                      ('cycles', 0)])
+
+# The ioctl requests that enable, disable and reset the counters
+PERF_EVENT_IOC_ENABLE = 0x2400
+PERF_EVENT_IOC_DISABLE = 0x2401
+PERF_EVENT_IOC_RESET = 0x2403
+
+# The bits of the flags of perf_event_attr, the counters start disabled, are
+# inherited by the threads created while counting, and exclude the kernel and
+# hypervisor so that they are permitted for unprivileged users
+DISABLED, INHERIT, EXCLUDE_KERNEL, EXCLUDE_HV = 1 << 0, 1 << 1, 1 << 5, 1 << 6
+
+# The file used to reset the peak resident memory of the process, since Linux 4.0
+CLEAR_REFS = '/proc/self/clear_refs'
+STATUS = '/proc/self/status'
+
+
+class PerfEventAttr(ctypes.Structure):
+    """The perf_event_attr structure of the perf_event_open system call, up to
+    the fields of the first published version of the structure.
+    """
+    _fields_ = [('type', ctypes.c_uint32),
+                ('size', ctypes.c_uint32),
+                ('config', ctypes.c_uint64),
+                ('sample_period', ctypes.c_uint64),
+                ('sample_type', ctypes.c_uint64),
+                ('read_format', ctypes.c_uint64),
+                ('flags', ctypes.c_uint64),
+                ('wakeup_events', ctypes.c_uint32),
+                ('bp_type', ctypes.c_uint32),
+                ('config1', ctypes.c_uint64)]
+
+
+def perf_counters():
+    """Opens the hardware counters of the calling process on any CPU, returns a
+    dictionary of the file descriptor of each event that is available, empty if
+    the counters are not supported or not permitted.
+    """
+    number = PERF_EVENT_OPEN.get(platform.machine())
+    if number is None:
+        return {}
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return {}
+
+    fds = OrderedDict()
+    for name, config in EVENTS.iteritems():
+        attr = PerfEventAttr(type=PERF_TYPE_HARDWARE, size=ctypes.sizeof(PerfEventAttr),
+                             config=config,
+                             flags=DISABLED | INHERIT | EXCLUDE_KERNEL | EXCLUDE_HV)
+        fd = libc.syscall(number, ctypes.byref(attr), 0, -1, -1, 0)
+        if fd >= 0:
+            fds[name] = fd
+    return fds
+
+
+def peak_rss():
+    """Returns the peak resident memory of the process in bytes."""
+    try:
+        with open(STATUS, 'r') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    # The maximum resident memory is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def current_rss():
+    """Returns the resident memory of the process in bytes."""
+    try:
+        with open(STATUS, 'r') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return peak_rss()
+
+
+def reset_peak_rss():
+    """Resets the peak resident memory of the process to the current resident
+    memory, returns False if it cannot be reset.
+    """
+    try:
+        with open(CLEAR_REFS, 'w') as refs:
+            refs.write('5')
+        return True
+    except IOError:
+        return False
+
+
+def cpu_time():
+    """Returns the user and system CPU time used by all of the threads of the
+    process, child processes such as the pool of a kernel are not included.
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Profile(object):
+    """Measures the resources used by the region between start and stop, which
+    may be started and stopped repeatedly such as for each run of a kernel. The
+    totals are the CPU time, the hardware counters if they are available, and the
+    peak resident memory along with the memory allocated, the growth of the peak
+    above the resident memory when started.
+    """
+
+    def __init__(self, counters=False):
+        """Initializes the profile, opening the hardware counters if requested."""
+        self.fds = perf_counters() if counters else {}
+        self.cpu = 0.0
+        self.counts = OrderedDict((name, 0) for name in self.fds)
+        self.peak = 0
+        self.allocated = None
+        self._cpu = None
+        self._resident = None
+
+    def start(self):
+        """Starts measuring the region."""
+        # The peak resident memory is reset so that the memory allocated is that of
+        # the region, not the setup of the matrices between the regions
+        if reset_peak_rss():
+            self._resident = current_rss()
+        for fd in self.fds.itervalues():
+            ioctl(fd, PERF_EVENT_IOC_RESET, 0)
+            ioctl(fd, PERF_EVENT_IOC_ENABLE, 0)
+        self._cpu = cpu_time()
+
+    def stop(self):
+        """Stops measuring the region and adds the resources used to the totals."""
+        self.cpu += cpu_time() - self._cpu
+        for name, fd in self.fds.iteritems():
+            ioctl(fd, PERF_EVENT_IOC_DISABLE, 0)
+            self.counts[name] += ctypes.c_uint64.from_buffer_copy(os.read(fd, 8)).value
+        peak = peak_rss()
+        self.peak = max(self.peak, peak)
+        if self._resident is not None:
+            self.allocated = max(self.allocated, peak - self._resident)
+
+    def results(self, runs=1):
+        """Returns the CPU time and counts per run of the region, and the peak and
+        allocated resident memory in megabytes, the largest of any run. The memory
+        allocated is only measured if the peak can be reset, and the cache miss rate
+        if the cache references are counted.
+        """
+        results = OrderedDict([('cpu', self.cpu / runs), ('peak_rss', self.peak / 2.0**20)])
+        if self.allocated is not None:
+            results['allocated'] = max(self.allocated, 0) / 2.0**20
+        for name, count in self.counts.iteritems():
+            results[name] = count / float(runs)
+        if self.counts.get('cache_refs'):
+            results['miss_rate'] = self.counts['cache_misses'] / float(self.counts['cache_refs'])
+        return results
+
+    def close(self):
+        """Closes the hardware counters."""
+        for fd in self.fds.itervalues():
+            os.close(fd)
+        self.fds = {}
@@ -0,0 +1,60 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Sparse matrix multiplication using the scipy CSR format, so the cost of the
+# multiplication scales with the number of non-zero values rather than the
+# dimensions of the matrices.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import scipy.sparse
+from docopt import docopt
+from helpers import kernel, time_kernel, report, usage, schema
+from schema import SchemaError
+
+
+def setup(A, B, args):
+    """Converts A to CSR format and B to the format given by --rhs, the matrices
+    are converted before timing as the benchmark measures the multiplication.
+    """
+    A = scipy.sparse.csr_matrix(A)
+    if args['--rhs'] == 'csr':
+        B = scipy.sparse.csr_matrix(B)
+    elif scipy.sparse.issparse(B):
+        B = B.toarray()
+    return A, B
+
+
+@kernel(setup=setup, fmt='auto')
+def csr(A, B):
+    """Computes the matrix multiplication of the CSR matrix A with the CSR or dense
+    matrix B.
+    """
+    return A.dot(B)
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Calculate the execution time for the sparse multiplication
+    report(time_kernel(__name__, args))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Evolutionary strategy search for the parameters of the approximate matrix
+# multiplication, the mixture of the uniform and norm-based sampling
+# probabilities and the ratio of samples, balancing the runtime and the error.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import os
+
+# The candidates are timed concurrently by the processes of the pool, each with a
+# single BLAS thread so that the cores are not oversubscribed, which can only be
+# set before NumPy is imported, the same variables as runner.BLAS_THREADS
+BLAS_THREADS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+os.environ.update((name, '1') for name in BLAS_THREADS)
+
+import numpy as np
+from multiprocessing import Pool, cpu_count
+from docopt import docopt
+from schema import Schema, And, Or, Use, SchemaError
+from helpers import clock, gen_matrix, save_tuning, DISTS
+import approx
+
+usage = """Evolutionary Strategy Search
+
+Usage:
+  evolve.py --dtype=<type> [options] DIM...
+  evolve.py -h | --help
+
+  Searches for the parameters of the approximate multiplication of the matrices
+  with each of the dimensions and saves the best, which are used by approx.py
+  given --approx=tuned.
+
+Arguments:
+  DIM                 The dimensions of the square matrices.
+
+Options:
+  -h, --help          Show this screen and exit.
+  --dtype=<type>      Numpy data type e.g. float, int32, bool.
+  --mtype=<type>      Specific type of matrix, either adjacency or stochastic.
+  --dist=<name>       Statistical distribution [default: uniform].
+  --sparse=<val>      The sparsity of the matrix, fraction of non-zero values [default: 1.0].
+  --parents=<n>       Number of parents selected each generation [default: 4].
+  --offspring=<n>     Number of offspring mutated from the parents each generation [default: 12].
+  --generations=<n>   Number of generations [default: 10].
+  --weight=<val>      Weight of the relative error in the fitness, which is added to the
+                      runtime relative to np.dot [default: 1.0].
+  --trials=<n>        Number of products timed for the fitness of each candidate [default: 3].
+  --procs=<n>         Number of processes evaluating the candidates, by default the number
+                      of cores.
+  --seed=<n>          Seed for the search and generating the matrices [default: 0].
+"""
+
+schema = Schema({
+    'DIM': [Use(int, error='Matrix dimensions must be integers.')],
+    '--dtype': Use(str, error='--dtype=<type> must be a valid numpy data type.'),
+    '--mtype': Or(None, Use(str, error='--mtype=<type> must be a type of adjacency or stochastic.')),
+    '--dist': And(Use(str), lambda x: x in DISTS,
+                  error='--dist=<name> must be one of ' + ', '.join(DISTS) + '.'),
+    '--sparse': And(Use(float), lambda x: 0.0 < x <= 1.0,
+                    error='--sparse=<val> must be a floating point value in (0, 1].'),
+    '--parents': And(Use(int), lambda n: n > 0, error='--parents=<n> must be a positive integer.'),
+    '--offspring': And(Use(int), lambda n: n > 0,
+                       error='--offspring=<n> must be a positive integer.'),
+    '--generations': And(Use(int), lambda n: n >= 0,
+                         error='--generations=<n> must be a non-negative integer.'),
+    '--weight': And(Use(float), lambda x: x >= 0, error='--weight=<val> must be non-negative.'),
+    '--trials': And(Use(int), lambda n: n > 0, error='--trials=<n> must be a positive integer.'),
+    '--procs': Or(None, And(Use(int), lambda n: n > 0,
+                  error='--procs=<n> must be a positive integer.')),
+    '--seed': Use(int, error='--seed=<n> must be an integer.'),
+    '--help': Or(None, Use(bool))
+})
+
+# The bounds of the mixture and the ratio of samples of a genome
+BOUNDS = np.array([[0.0, 1.0], [0.01, 1.0]])
+
+# The initial mutation strength of each parameter and its learning rate
+SIGMA = np.array([0.25, 0.25])
+TAU = 1.0 / np.sqrt(len(SIGMA))
+
+# The matrices, their product and the runtime of np.dot for each problem evaluated
+# by a process of the pool
+_problems = {}
+
+
+def quantize(genome):
+    """Returns the genome clipped to the bounds and rounded to two decimals, so
+    that similar genomes share the cached fitness.
+    """
+    genome = np.clip(genome, BOUNDS[:, 0], BOUNDS[:, 1])
+    return tuple(round(x, 2) for x in genome)
+
+
+def load_problem(key):
+    """Returns the matrices, their product, and the fastest runtime of np.dot of
+    the problem, generated once by each process of the pool.
+    """
+    if key not in _problems:
+        dim, dtype, mtype, dist, sparse, seed, trials = key
+        A = gen_matrix(dim, dim, dtype, mtype, dist=dist, sparse=sparse, seed=[seed, 0])
+        B = gen_matrix(dim, dim, dtype, mtype, dist=dist, sparse=sparse, seed=[seed, 1])
+        runtimes = []
+        for trial in range(trials):
+            start = clock()
+            P = np.dot(A, B)
+            runtimes.append(clock() - start)
+        _problems[key] = (A, B, P.astype(np.float64), min(runtimes))
+    return _problems[key]
+
+
+def evaluate(task):
+    """Returns the runtime relative to np.dot and the mean relative error of the
+    approximate multiplication for the problem with the genome.
+    """
+    key, genome = task
+    A, B, P, baseline = load_problem(key)
+    mix, ratio = genome
+    samples = approx.sample_count(A.shape[1], ratio)
+    S = np.empty((A.shape[0], samples))
+    R = np.empty((samples, B.shape[1]))
+
+    runtimes, errors = [], []
+    for trial in range(key[-1]):
+        # The norms are computed by every product, as they would be for new matrices
+        approx._norms.clear()
+        start = clock()
+        C = approx.approx(A, B, S, R, mix)
+        runtimes.append(clock() - start)
+        errors.append(np.linalg.norm(C - P) / np.linalg.norm(P) if P.any() else 0.0)
+    return min(runtimes) / max(baseline, 1e-9), np.mean(errors)
+
+
+class Search(object):
+    """A (mu + lambda) evolutionary strategy with self-adaptive mutation strengths,
+    each genome is the mixture of the norm-based sampling probabilities and the
+    ratio of samples. The fitness to minimize is the runtime relative to np.dot
+    plus the weighted relative error, and is cached for each genome.
+    """
+
+    def __init__(self, pool, key, parents, offspring, weight, rng):
+        self.pool = pool
+        self.key = key
+        self.parents = parents
+        self.offspring = offspring
+        self.weight = weight
+        self.rng = rng
+        self.cache = {}
+
+    def fitness(self, genome):
+        """Returns the fitness of the evaluated genome."""
+        runtime, error = self.cache[genome]
+        return runtime + self.weight * error
+
+    def evaluate(self, genomes):
+        """Evaluates the genomes not already cached across the pool."""
+        pending = sorted(set(g for g in genomes if g not in self.cache))
+        results = self.pool.map(evaluate, [(self.key, g) for g in pending], chunksize=1)
+        self.cache.update(zip(pending, results))
+
+    def select(self, population):
+        """Returns the fittest individuals with distinct genomes."""
+        selected, genomes = [], set()
+        for genome, sigma in sorted(population, key=lambda i: self.fitness(i[0])):
+            if genome not in genomes:
+                selected.append((genome, sigma))
+                genomes.add(genome)
+        return selected[:self.parents]
+
+    def mutate(self, parents):
+        """Returns the offspring mutated from the parents chosen at random."""
+        offspring = []
+        for i in range(self.offspring):
+            genome, sigma = parents[self.rng.randint(len(parents))]
+            sigma = sigma * np.exp(TAU * self.rng.randn(len(sigma)))
+            offspring.append((quantize(genome + sigma * self.rng.randn(len(sigma))), sigma))
+        return offspring
+
+    def run(self, generations):
+        """Returns the best genome after the generations, the initial population
+        includes the uniform and non-uniform methods with the default ratio.
+        """
+        population = [(quantize([approx.MIX[method], 0.75]), SIGMA) for method in approx.MIX]
+        population += [(quantize(self.rng.uniform(BOUNDS[:, 0], BOUNDS[:, 1])), SIGMA)
+                       for i in range(self.parents)]
+        self.evaluate([genome for genome, sigma in population])
+        parents = self.select(population)
+
+        for generation in range(generations):
+            offspring = self.mutate(parents)
+            self.evaluate([genome for genome, sigma in offspring])
+            parents = self.select(parents + offspring)
+            best = parents[0][0]
+            print '  generation %d: mix %0.2f, ratio %0.2f, fitness %0.3f (%d evaluated)' %\
+                (generation + 1, best[0], best[1], self.fitness(best), len(self.cache))
+        return parents[0][0]
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # The candidates are timed concurrently by the processes of the pool, which
+    # should not exceed the number of cores to avoid distorting the runtimes
+    rng = np.random.RandomState(args['--seed'])
+    pool = Pool(args['--procs'] or cpu_count())
+    try:
+        for dim in args['DIM']:
+            print '%s %s %d:' % (args['--dtype'], args['--mtype'] or 'dense', dim)
+            key = (dim, args['--dtype'], args['--mtype'], args['--dist'], args['--sparse'],
+                   args['--seed'], args['--trials'])
+            search = Search(pool, key, args['--parents'], args['--offspring'],
+                            args['--weight'], rng)
+            best = search.run(args['--generations'])
+            runtime, error = search.cache[best]
+            save_tuning('approx', approx.tuning_key(args['--dtype'], args['--mtype'], dim),
+                        {'mix': best[0], 'ratio': best[1], 'runtime': runtime, 'error': error})
+            print '  best: mix %0.2f, ratio %0.2f, runtime %0.3f of np.dot, error %0.3f' %\
+                (best[0], best[1], runtime, error)
+    finally:
+        pool.terminate()
+        pool.join()
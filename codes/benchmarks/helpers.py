@@ -22,10 +22,63 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ###############################################################################
+import os
+import sys
 import time
+import json
+import hashlib
 import numpy as np
+import scipy.sparse
+import scipy.stats
+from os import path
+from counters import Profile
+from collections import OrderedDict
 from schema import Schema, And, Or, Use
 
+# The kernels registered by each benchmark, used to execute them in-process
+kernels = OrderedDict()
+
+# The metrics of the last kernel timed, such as the error of the result
+metrics = OrderedDict()
+
+# The time of each phase of the last benchmark, such as the generation of the
+# matrices, and the checksum of its result and the times of each of its runs,
+# which are reported with the metrics
+phases = OrderedDict()
+result = {'checksum': None, 'times': None}
+
+# The environment variable of the file the report of the benchmark is written
+# to, given by the test framework, a file rather than a descriptor since mpiexec
+# only passes the environment to the processes it starts
+REPORT = 'BENCHMARK_REPORT'
+
+# The version of the report of a benchmark
+PROTOCOL = 1
+
+# The numpy data types of the generated matrices
+DTYPES = {'int32': np.int32, 'bool': np.uint8, 'float': np.float64}
+
+# The probability of 0, 1, 2, and 3 connections between vertexes of an adjacency matrix
+ADJACENCY = [0.70, 0.15, 0.10, 0.05]
+
+# The size in bytes of the panels of rows generated at a time
+CHUNK_BYTES = 2**26
+
+# The statistical distributions the values of the matrices are sampled from
+DISTS = ['zero', 'uniform', 'normal', 'weibull', 'poisson']
+
+# The density below which matrices are generated in CSR format when requested
+SPARSE_THRESHOLD = 0.35
+
+# The directory where the benchmarks persist their tuned parameters
+TUNING_DIR = path.join(path.dirname(path.abspath(__file__)), 'tuning')
+
+
+# The timer of the benchmarks, Python 2 has no high resolution performance counter
+# and time.time has microsecond resolution with a lower overhead than the
+# alternatives, the kernels are repeated to time them more precisely
+clock = time.time
+
 
 def timing(f):
     """Helpful decorator to get runtime of functions"""
@@ -38,15 +91,406 @@ def timing(f):
     return wrap
 
 
-def gen_matrix(m, n, dtype, mtype=None, dist='uniform', sparse=1.00, empty=False):
-    """Generates a dynamic matrix given the parameters specified.
+def kernel(setup=None, fmt='dense', verify=False, error=None):
+    """Decorator that registers the function as the kernel of the benchmark module
+    so that the test framework can load it once and time it in-process.
+
+    :param setup: Optional function given the matrices A, B and the validated
+                  arguments, that returns the arguments for the kernel. The
+                  arguments are (A, B) by default.
+    :param fmt: The format of the matrices A and B given to setup, see gen_matrix
+    :param verify: Record the relative error of the product returned by the kernel
+                   for float matrices as the error metric, which is recorded
+                   for every kernel given --accuracy
+    :param error: Optional function given the result of the kernel and the
+                  matrices A, B that returns the error metric, by default the
+                  relative error of the result compared to np.dot(A, B)
+    """
+    def wrap(f):
+        kernels[f.__module__] = (f, setup, fmt, verify, error or relative_error)
+        return f
+    return wrap
+
+
+def confidence(times):
+    """Returns the half-width of the 95% confidence interval of the mean of the
+    times relative to the mean, infinite for less than 3 times.
+    """
+    if len(times) < 3 or np.mean(times) <= 0:
+        return np.inf
+    half = scipy.stats.t.ppf(0.975, len(times) - 1) * np.std(times, ddof=1) / np.sqrt(len(times))
+    return half / np.mean(times)
+
+
+def time_kernel(module, args):
+    """Generates the matrices for the arguments and returns the execution time of
+    the kernel registered by the module. The kernel is run --warmup times before
+    it is timed, and is timed up to --repeat times until the confidence interval
+    of the times is within --ci, the median of the times is returned. The kernel
+    is no longer warmed up or repeated after --max-time seconds, so the kernels
+    that take long are only timed once, and a warm-up that alone takes longer is
+    timed as the only run. The arguments of the kernel are set up again for each
+    run as kernels may update them.
+
+    Given --profile the resources used by the timed runs are recorded as metrics,
+    the CPU time and hardware counters per run, the peak and allocated resident
+    memory, and the rate of floating point operations of the dense product of A
+    and B in GFLOP/s.
+
+    The time to generate the matrices and the execution time are recorded as the
+    generation and compute phases, unless the kernel records its own phases, along
+    with the checksum of the result.
+
+    :param module: The name of the module that registered the kernel
+    :param args: The validated command line arguments of the benchmark
+    """
+    f, setup, fmt, verify, error = kernels[module]
+    phases.clear()
+    start = clock()
+    A, B = gen_operands(args, fmt=fmt)
+    phases['generation'] = clock() - start
+    kernel_args = lambda: (A, B) if setup is None else setup(A, B, args)
+
+    times, total = [], 0.0
+    profile = Profile(counters=True) if args['--profile'] else None
+    start = clock()
+    for i in range(args['--warmup']):
+        if clock() - start > args['--max-time']:
+            break
+        fargs = kernel_args()
+        metrics.clear()
+        run = clock()
+        C = f(*fargs)
+        run = clock() - run
+        # A kernel that takes longer than --max-time is not run again, the warm-up
+        # is its only timed run unless the runs are profiled
+        if run > args['--max-time'] and profile is None:
+            times, total = [run], run
+            break
+
+    while not times or not (len(times) >= args['--repeat'] or total > args['--max-time'] or
+                            confidence(times) <= args['--ci']):
+        fargs = kernel_args()
+        metrics.clear()
+        if profile is not None:
+            profile.start()
+        start = clock()
+        C = f(*fargs)
+        times.append(clock() - start)
+        if profile is not None:
+            profile.stop()
+        total += times[-1]
+
+    runtime = float(np.median(times))
+    if len(times) > 1:
+        metrics['repeats'] = len(times)
+    if (verify and A.dtype.kind == 'f') or args['--accuracy']:
+        metrics['error'] = error(C, A, B)
+    if profile is not None:
+        profile.close()
+        metrics.update(profile.results(len(times)))
+        if runtime > 0:
+            metrics['gflops'] = 2.0 * A.shape[0] * A.shape[1] * B.shape[1] / runtime / 1e9
+    phases.setdefault('compute', runtime)
+    result['checksum'] = checksum(C)
+    result['times'] = times
+    return runtime
+
+
+def checksum(C):
+    """Returns the sum of the values of the result of a kernel as a float, of each
+    result in order if there are several such as the powers of a matrix, or None
+    if there is no result.
+    """
+    if C is None:
+        return None
+    if isinstance(C, dict):
+        return sum(checksum(C[k]) for k in sorted(C))
+    if scipy.sparse.issparse(C):
+        return float(C.sum(dtype=np.float64))
+    return float(np.sum(C, dtype=np.float64))
+
+
+def message(runtime, checksum=None):
+    """Returns the report of the benchmark for the test framework, the execution
+    time, the time of each phase, the metrics and the checksum of the result,
+    by default that of the last kernel timed, along with the times of each of
+    the runs of the kernel timed.
+    """
+    return OrderedDict([('version', PROTOCOL),
+                        ('time', runtime),
+                        ('times', result['times'] or [runtime]),
+                        ('phases', dict(phases)),
+                        ('metrics', dict(metrics)),
+                        ('checksum', result['checksum'] if checksum is None else checksum)])
+
+
+def report(runtime, checksum=None):
+    """Reports the execution time of the benchmark along with the phases, metrics
+    and checksum of the result. The report is written as a line of JSON to the
+    file given by the test framework, so that the output of the benchmark and
+    the processes it starts is not mistaken for the result, otherwise the runtime
+    is printed to stdout and the metrics to stderr.
+    """
+    file = os.environ.get(REPORT)
+    if file:
+        with open(file, 'a') as fp:
+            fp.write(json.dumps(message(runtime, checksum)) + '\n')
+    else:
+        print "%0.9f" % runtime
+        print_metrics()
+
+
+def print_metrics():
+    """Prints the phases and metrics of the last kernel timed to stderr, the
+    runtime is the only output to stdout.
+    """
+    for name, value in phases.items() + metrics.items():
+        sys.stderr.write('%s: %s\n' % (name, value))
+
+
+def relative_error(C, A, B):
+    """Returns the Frobenius norm relative error of C compared to np.dot(A, B),
+    sparse matrices are compared as dense matrices and integer matrices are
+    multiplied without overflow.
+    """
+    dense = lambda X: X.toarray() if scipy.sparse.issparse(X) else X
+    A, B, C = dense(A), dense(B), dense(C)
+
+    # Integer matrices are multiplied as 64-bit integers, as the product of 32-bit
+    # integers silently overflows
+    if A.dtype.kind in 'biu' and B.dtype.kind in 'biu':
+        A, B = A.astype(np.int64), B.astype(np.int64)
+    P = np.dot(A, B).astype(np.float64)
+    norm = np.linalg.norm(P)
+    return np.linalg.norm(C - P) / norm if norm > 0 else np.linalg.norm(C)
+
+
+def gen_operands(args, mmap=True, fmt='dense'):
+    """Generates the matrices A and B for the arguments of the benchmark. If a seed
+    is given the matrices are the same for every benchmark, and are loaded from the
+    matrix store when a cache directory is given.
+
+    :param args: The validated command line arguments of the benchmark
+    :param mmap: Load the matrices from the store as read-only memory maps
+    :param fmt: The format of the matrices, see gen_matrix
+    """
+    dim, dtype, mtype, seed = args['DIM'], args['--dtype'], args['--mtype'], args['--seed']
+    params = dict(dist=args['--dist'], sparse=args['--sparse'], fmt=fmt)
+    if seed is None or args['--cache'] is None:
+        A = gen_matrix(dim, dim, dtype, mtype, seed=None if seed is None else [seed, 0], **params)
+        B = gen_matrix(dim, dim, dtype, mtype, seed=None if seed is None else [seed, 1], **params)
+        return A, B
+
+    store = MatrixStore(args['--cache'], capacity=int(args['--cache-size'] * 2**20))
+    A = store.get(dim, dim, dtype, mtype, seed=[seed, 0], mmap=mmap, **params)
+    B = store.get(dim, dim, dtype, mtype, seed=[seed, 1], mmap=mmap, **params)
+    return A, B
+
+
+class MatrixStore(object):
+    """An on-disk store of generated matrices, each matrix is generated once and
+    saved as a .npy file addressed by the hash of the parameters it was generated
+    with. The least recently used matrices are evicted when the total size of the
+    store exceeds its capacity.
+    """
+
+    def __init__(self, directory, capacity=2**30):
+        """Initializes the store in the directory with the capacity in bytes."""
+        self.directory = directory
+        self.capacity = capacity
+        if not path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not path.isdir(directory):
+                    raise
+
+    def key(self, m, n, dtype, mtype, dist, sparse, seed, csr=False):
+        """Returns the key of the matrix generated with the parameters."""
+        params = repr((m, n, dtype, mtype or None, dist, float(sparse), seed))
+        if csr:
+            params += ' csr'
+        return hashlib.sha1(params).hexdigest()
+
+    def get(self, m, n, dtype, mtype=None, dist='uniform', sparse=1.00, seed=0, mmap=True,
+            fmt='dense'):
+        """Returns the matrix generated with the parameters, see gen_matrix, as a
+        read-only memory map of the stored matrix unless mmap is False. Sparse
+        matrices in CSR format are stored as .npz files and loaded into memory.
+        """
+        csr = is_csr(mtype, sparse, fmt)
+        key = self.key(m, n, dtype, mtype, dist, sparse, seed, csr)
+        file = path.join(self.directory, key + ('.npz' if csr else '.npy'))
+        if path.exists(file):
+            # Update the modification time to record the use of the matrix
+            os.utime(file, None)
+        elif csr:
+            tmp = '%s.%d.tmp' % (file, os.getpid())
+            with open(tmp, 'wb') as fp:
+                scipy.sparse.save_npz(fp, gen_matrix(m, n, dtype, mtype, dist, sparse, seed=seed,
+                                                     fmt='csr'))
+            os.rename(tmp, file)
+            self.evict(keep=file)
+        else:
+            # Generate into a temporary file first as other processes may use the store
+            tmp = '%s.%d.tmp' % (file, os.getpid())
+            A = np.lib.format.open_memmap(tmp, mode='w+', dtype=matrix_dtype(dtype, mtype),
+                                          shape=(m, n))
+            gen_matrix(m, n, dtype, mtype, dist, sparse, seed=seed, out=A)
+            A.flush()
+            del A
+            os.rename(tmp, file)
+            self.evict(keep=file)
+
+        if csr:
+            return scipy.sparse.load_npz(file)
+        elif not mmap:
+            return np.load(file)
+        # A plain view of the memory map avoids the overhead of indexing np.memmap
+        return np.load(file, mmap_mode='r').view(np.ndarray)
+
+    def evict(self, keep=None):
+        """Removes the least recently used matrices until the store fits in its
+        capacity, the file keep is never removed.
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            file = path.join(self.directory, name)
+            if name.endswith(('.npy', '.npz')) and file != keep:
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, file))
+
+        total = sum(size for mtime, size, file in files)
+        if keep is not None and path.exists(keep):
+            total += path.getsize(keep)
+        for mtime, size, file in sorted(files):
+            if total <= self.capacity:
+                break
+            try:
+                os.remove(file)
+            except OSError:
+                pass
+            total -= size
+
+
+def load_tuning(name):
+    """Returns the dictionary of parameters tuned by the benchmark."""
+    file = path.join(TUNING_DIR, name + '.json')
+    if not path.exists(file):
+        return {}
+    with open(file, 'r') as fp:
+        return json.load(fp)
+
+
+def save_tuning(name, key, value):
+    """Persists the parameter tuned by the benchmark for the key."""
+    if not path.isdir(TUNING_DIR):
+        try:
+            os.makedirs(TUNING_DIR)
+        except OSError:
+            if not path.isdir(TUNING_DIR):
+                raise
+    tuning = load_tuning(name)
+    tuning[key] = value
+
+    # Write to a temporary file first as other processes may read the parameters
+    file = path.join(TUNING_DIR, name + '.json')
+    tmp = '%s.%d.tmp' % (file, os.getpid())
+    with open(tmp, 'w') as fp:
+        json.dump(tuning, fp, indent=4, sort_keys=True)
+    os.rename(tmp, file)
+
+
+def split(n, parts):
+    """Splits n rows as evenly as possible into the number of parts, returns the
+    number of rows and the first row of each part.
+    """
+    counts = [n // parts + (1 if i < n % parts else 0) for i in range(parts)]
+    starts = [sum(counts[:i]) for i in range(parts)]
+    return counts, starts
+
+
+def empty_result(A, B, args):
+    """Setup for kernels that accumulate the product into an empty matrix C."""
+    return A, B, gen_matrix(A.shape[0], B.shape[1], args['--dtype'], empty=True)
+
+
+def matrix_dtype(dtype, mtype=None):
+    """Returns the numpy data type of the matrices generated for the parameters."""
+    if mtype == 'adjacency':
+        return np.dtype(np.int32)
+    elif mtype == 'stochastic':
+        return np.dtype(np.float64)
+    return np.dtype(DTYPES[dtype])
+
+
+def density(mtype=None, sparse=1.00):
+    """Returns the expected fraction of non-zero values of the generated matrices."""
+    if mtype == 'adjacency':
+        return sparse * (1.0 - ADJACENCY[0])
+    return sparse
+
+
+def is_csr(mtype=None, sparse=1.00, fmt='dense'):
+    """Returns True if matrices generated in the format are in CSR format, the
+    format auto uses CSR for matrices with a density below SPARSE_THRESHOLD.
+    """
+    return fmt == 'csr' or (fmt == 'auto' and density(mtype, sparse) < SPARSE_THRESHOLD)
+
+
+def sample(rng, dist, dtype, shape):
+    """Samples the values of a float or int32 matrix from the distribution, the
+    int32 values are positive with a mean of about 50.
+    """
+    if dist == 'zero':
+        return np.zeros(shape, dtype=DTYPES[dtype])
+
+    if dtype == 'int32':
+        if dist == 'uniform':
+            return rng.randint(1, 101, size=shape, dtype=np.int32)
+        elif dist == 'normal':
+            values = np.clip(rng.normal(50.0, 15.0, shape), 1, None)
+        elif dist == 'weibull':
+            values = 56.0 * rng.weibull(1.5, shape)
+        elif dist == 'poisson':
+            values = rng.poisson(50.0, shape)
+        return np.rint(values).astype(np.int32)
+
+    if dist == 'uniform':
+        return rng.random_sample(shape)
+    elif dist == 'normal':
+        return rng.standard_normal(shape)
+    elif dist == 'weibull':
+        return rng.weibull(1.5, shape)
+    elif dist == 'poisson':
+        return rng.poisson(1.0, shape).astype(np.float64)
+
+
+def gen_matrix(m, n, dtype, mtype=None, dist='uniform', sparse=1.00, empty=False, seed=None,
+               out=None, chunk=None, fmt='dense'):
+    """Generates a dynamic matrix given the parameters specified. The matrix is
+    generated in panels of rows, directly into the output matrix if given, so that
+    large matrices can be generated into a memory map without a copy in memory.
+
+    The values of float and int32 matrices are sampled from the distribution, and
+    each value is non-zero with a probability of sparse. Stochastic matrices use
+    neither and adjacency matrices only use the sparsity.
 
     :param m: The rows of the matrix
     :param n: The columns of the matrix
     :param dtype: The data type must be supported by numpy
     :param mtype: The type of matrix: adjacency, stochastic, sparse
     :param dist: The distribution must be one of zero, uniform, normal, weibull, poisson
-    :param sparse: The sparsity of the matrix
+    :param sparse: The sparsity of the matrix, the fraction of values that are non-zero
+    :param seed: The seed for generating the matrix, random if None
+    :param out: Optional preallocated m x n output matrix of the matrix_dtype
+    :param chunk: The number of rows generated at a time, by default rows of CHUNK_BYTES
+    :param fmt: The format of the matrix: dense, csr, or auto to use a scipy.sparse
+                CSR matrix when the density is below SPARSE_THRESHOLD
     """
     if empty:
         if dtype == 'int32':
@@ -56,40 +500,86 @@ def gen_matrix(m, n, dtype, mtype=None, dist='uniform', sparse=1.00, empty=False
         elif dtype == 'float':
             return np.zeros([m, n], dtype=np.float)
 
-    if mtype == 'adjacency':
-        # Create an adjacency matrix representing a graph
-        A = np.int32(np.random.random_integers(1, 100, (m, n)))
-        A[A < 70] = 0  # 70% of vertexes are not completely connected
-        A[A >= 95] = 3  # 5% have 3
-        A[A >= 85] = 2  # 10% have 2 connections
-        A[A >= 70] = 1  # 15% of vertexes have 1 connection
-        return A
-    elif mtype == 'stochastic':
-        # Create a stochastic matrix representing a markov chain,
-        # where the sum of each col and row is 1
-        A = np.random.rand(m, n)
-        B = np.copy(A)
-        for i in range(0, m):
-            tot = np.sum(A[i, :])
-            A[i, :] /= tot
-        for j in range(0, n):
-            tot = np.sum(B[:, j])
-            B[:, j] /= tot
-        return np.dot(A, B)
+    rng = np.random.RandomState(seed)
+    csr = is_csr(mtype, sparse, fmt)
+    if out is None and not csr:
+        out = np.empty([m, n], dtype=matrix_dtype(dtype, mtype))
+    rows = chunk or max(1, CHUNK_BYTES // (8 * n))
 
-    if dtype == 'int32':
-        return np.int32(np.random.random_integers(1, 100, (m, n)))
+    if mtype == 'stochastic':
+        if csr:
+            return scipy.sparse.csr_matrix(gen_matrix(m, n, dtype, mtype, seed=seed, chunk=chunk))
+        # Create a stochastic matrix representing a markov chain, the product of the
+        # row normalized and column normalized copies of a random matrix X. Scaling
+        # the columns commutes with the product, so each panel is (X_i / r_i) X / c
+        X = rng.random_sample((m, n))
+        cols = X.sum(axis=0)
+        for i in range(0, m, rows):
+            panel = X[i:i+rows]
+            out[i:i+rows] = np.dot(panel / panel.sum(axis=1)[:, np.newaxis], X)
+            out[i:i+rows] /= cols
+        return out
+
+    # Sparse matrices are built from the CSR panels to limit memory to the non-zeros
+    panels = []
+    for i in range(0, m, rows):
+        panel = gen_panel(rng, (min(rows, m - i), n), dtype, mtype, dist, sparse)
+        if csr:
+            panels.append(scipy.sparse.csr_matrix(panel, dtype=matrix_dtype(dtype, mtype)))
+        else:
+            out[i:i+rows] = panel
+
+    if csr:
+        return scipy.sparse.vstack(panels, format='csr')
+    return out
+
+
+def gen_panel(rng, shape, dtype, mtype=None, dist='uniform', sparse=1.00):
+    """Generates the next panel of rows of a matrix from the random state, see
+    gen_matrix, the panels of a matrix must be generated in order.
+    """
+    if mtype == 'adjacency':
+        # Create an adjacency matrix representing a graph, sampling the number
+        # of connections between each of the vertexes
+        panel = rng.choice(len(ADJACENCY), size=shape, p=ADJACENCY).astype(np.int32)
     elif dtype == 'bool':
-        A = np.random.rand(m, n)
-        A[A < 0.5] = 0
-        A[A >= 0.5] = 1
-        A = A.astype('B')
-        return A
-    elif dtype == 'float':
-        return np.random.rand(m, n)
+        panel = rng.randint(0, 2, size=shape, dtype=np.uint8)
+    else:
+        panel = sample(rng, dist, dtype, shape)
+    if sparse < 1.0:
+        panel *= rng.random_sample(shape) < sparse
+    return panel
 
 
-def gen_vector(m, dtype, dist='uniform', sparse=1.00, empty=False):
+def gen_block(m, n, rows, cols, dtype, mtype=None, dist='uniform', sparse=1.00, seed=None,
+              chunk=None):
+    """Generates the block of the rows and columns of the dense matrix generated by
+    gen_matrix with the same parameters and seed. The panels of rows up to the end
+    of the block are generated in turn and only the block is kept, so the memory
+    used is that of the block and one panel. Stochastic matrices are the product
+    of a random matrix and are generated in full.
+
+    :param rows: The slice of the rows of the block
+    :param cols: The slice of the columns of the block
+    :param chunk: The number of rows generated at a time, by default rows of CHUNK_BYTES
+    """
+    if mtype == 'stochastic':
+        return np.array(gen_matrix(m, n, dtype, mtype, seed=seed, chunk=chunk)[rows, cols])
+
+    rng = np.random.RandomState(seed)
+    out = np.empty([rows.stop - rows.start, cols.stop - cols.start],
+                   dtype=matrix_dtype(dtype, mtype))
+    step = chunk or max(1, CHUNK_BYTES // (8 * n))
+    for i in range(0, rows.stop, step):
+        panel = gen_panel(rng, (min(step, m - i), n), dtype, mtype, dist, sparse)
+        # The rows of the panel within the block
+        start, stop = max(i, rows.start), min(i + step, rows.stop)
+        if start < stop:
+            out[start - rows.start:stop - rows.start] = panel[start - i:stop - i, cols]
+    return out
+
+
+def gen_vector(m, dtype, dist='uniform', sparse=1.00, empty=False, seed=None):
     """Generates a dynamic vector given the parameters specified.
 
     :param m: The rows of the matrix
@@ -97,6 +587,7 @@ def gen_vector(m, dtype, dist='uniform', sparse=1.00, empty=False):
     :param dtype: The data type must be supported by numpy
     :param dist: The distribution must be one of zero, uniform, normal, weibull, poisson
     :param sparse: The sparsity of the matrix
+    :param seed: The seed for generating the vector, random if None
     """
     if empty:
         if dtype == 'int32':
@@ -105,22 +596,20 @@ def gen_vector(m, dtype, dist='uniform', sparse=1.00, empty=False):
             return np.zeros(m, dtype=np.int8)
         elif dtype == 'float':
             return np.zeros(m, dtype=np.float)
+
+    rng = np.random.RandomState(seed)
     if dtype == 'int32':
-        return np.int32(np.random.random_integers(1, 100, m))
+        return rng.randint(1, 101, size=m, dtype=np.int32)
     elif dtype == 'bool':
-        A = np.random.rand(m)
-        A[A < 0.5] = 0
-        A[A >= 0.5] = 1
-        A = A.astype('B')
-        return A
+        return rng.randint(0, 2, size=m, dtype=np.uint8)
     elif dtype == 'float':
-        return np.random.rand(m)
+        return rng.random_sample(m)
 
 # The docopt string for command line usage of all benchmark programs
 usage = """Benchmarks
 
 Usage:
-  benchmark.py --dtype=<type> [--mtype=<type> --dist=<name> --sparse=<val> --approx=<type>] DIM
+  benchmark.py --dtype=<type> [options] DIM
   benchmark.py -h | --help
 
 Arguments:
@@ -131,8 +620,41 @@ Options:
   --dtype=<type>   Numpy data type e.g. float, int32, bool.
   --mtype=<type>   Specific type of matrix, either adjacency or stochastic.
   --dist=<name>    Statistical distribution [default: uniform].
-  --sparse=<val>   The sparsity of the matrix [default: 1.0].
-  --approx=<type>  Type of approximate multiplication, uniform or non-uniform [default: uniform].
+  --sparse=<val>   The sparsity of the matrix, fraction of non-zero values [default: 1.0].
+  --rhs=<fmt>      Format of the matrix B for sparse multiplication, csr or dense [default: csr].
+  --powers=<list>  Powers of the matrix computed by the Markov chain benchmark, separated by
+                   commas [default: 2,16,64].
+  --route=<name>   Route of the Markov chain benchmark, squaring, eigen or auto which uses the
+                   eigendecomposition for large powers [default: auto].
+  --semiring=<name>  Semiring of bit-packed boolean multiplication, the count of the entries
+                   set in both or whether any entry is set, count or or [default: count].
+  --tile=<n>       Tile size for blocked multiplication, autotuned if not given.
+  --cutover=<n>    Dimension at which Strassen multiplication uses np.dot [default: 128].
+  --approx=<type>  Type of approximate multiplication, uniform, non-uniform or tuned
+                   [default: uniform].
+  --ratio=<val>    Number of samples for approximate multiplication as a fraction of the
+                   dimension [default: 0.75].
+  --samples=<n>    Number of samples for approximate multiplication, overrides --ratio.
+  --target=<err>   Target relative error of approximate multiplication, samples are added
+                   until the estimated error is met, using at most the number of samples.
+  --mode=<mode>    Distribution of the rows for parallel multiplication, dynamic, pipelined or
+                   static [default: dynamic].
+  --rows=<n>       Rows of the matrix sent per message for dynamic parallel multiplication [default: 1].
+  --master-share   The master also computes panels for pipelined parallel multiplication.
+  --procs=<n>      Number of processes for shared memory parallel multiplication [default: 4].
+  --threads=<n>    Number of threads for threaded tiled multiplication [default: 4].
+  --accuracy       Record the relative error of the product compared to np.dot.
+  --profile        Record the CPU time, memory, hardware counters and GFLOP/s of the kernel.
+  --budget=<MB>    Memory budget of out-of-core multiplication in megabytes [default: 256].
+  --warmup=<n>     Number of untimed runs of the kernel before it is timed [default: 0].
+  --repeat=<n>     Maximum number of times the kernel is timed, the median is the execution
+                   time [default: 1].
+  --ci=<frac>      Target relative half-width of the 95% confidence interval of the times of
+                   the kernel, it is no longer repeated once reached [default: 0.05].
+  --max-time=<s>   Time after which the kernel is no longer warmed up or repeated [default: 1.0].
+  --seed=<n>       Seed for generating the matrices, random if not given.
+  --cache=<dir>    Directory of the matrix store, matrices are not stored if not given.
+  --cache-size=<MB>  Maximum size of the matrix store in megabytes [default: 1024].
 
 """
 
@@ -141,9 +663,42 @@ schema = Schema({
     'DIM': Use(int, error='Matrix dimension must be an integer.'),
     '--dtype': Use(str, error='--dtype=<type> must be a valid numpy data type.'),
     '--mtype': Or(None, Use(str, error='--mtype=<type> must be a type of adjacency or stochastic.')),
-    '--dist': Or(None, Use(str, error='--dist=<name> must be a valid distribution.')),
-    '--sparse': Or(None, Use(float, error='--sparse=<val> must be a floating point value.')),
-    '--approx': Or(None, And(Use(str), lambda x: x in ['uniform', 'non-uniform'],
-                   error='--approx=<type> must be uniform or non-uniform.')),
+    '--dist': Or(None, And(Use(str), lambda x: x in DISTS,
+                 error='--dist=<name> must be one of ' + ', '.join(DISTS) + '.')),
+    '--sparse': Or(None, And(Use(float), lambda x: 0.0 < x <= 1.0,
+                   error='--sparse=<val> must be a floating point value in (0, 1].')),
+    '--rhs': Or(None, And(Use(str), lambda x: x in ['csr', 'dense'],
+                error='--rhs=<fmt> must be csr or dense.')),
+    '--approx': Or(None, And(Use(str), lambda x: x in ['uniform', 'non-uniform', 'tuned'],
+                   error='--approx=<type> must be uniform, non-uniform or tuned.')),
+    '--ratio': And(Use(float), lambda x: x > 0, error='--ratio=<val> must be a positive value.'),
+    '--samples': Or(None, And(Use(int), lambda n: n > 0,
+                    error='--samples=<n> must be a positive integer.')),
+    '--target': Or(None, And(Use(float), lambda x: x > 0,
+                   error='--target=<err> must be a positive value.')),
+    '--powers': And(Use(lambda x: [int(k) for k in x.split(',')]), lambda x: min(x) > 0,
+                    error='--powers=<list> must be positive integers separated by commas.'),
+    '--route': And(Use(str), lambda x: x in ['squaring', 'eigen', 'auto'],
+                   error='--route=<name> must be squaring, eigen or auto.'),
+    '--semiring': And(Use(str), lambda x: x in ['count', 'or'],
+                      error='--semiring=<name> must be count or or.'),
+    '--tile': Or(None, And(Use(int), lambda n: n > 0, error='--tile=<n> must be a positive integer.')),
+    '--cutover': And(Use(int), lambda n: n > 0, error='--cutover=<n> must be a positive integer.'),
+    '--mode': And(Use(str), lambda x: x in ['dynamic', 'pipelined', 'static'],
+                  error='--mode=<mode> must be dynamic, pipelined or static.'),
+    '--master-share': Or(None, Use(bool)),
+    '--procs': And(Use(int), lambda n: n > 0, error='--procs=<n> must be a positive integer.'),
+    '--threads': And(Use(int), lambda n: n > 0, error='--threads=<n> must be a positive integer.'),
+    '--rows': And(Use(int), lambda n: n > 0, error='--rows=<n> must be a positive integer.'),
+    '--accuracy': Or(None, Use(bool)),
+    '--profile': Or(None, Use(bool)),
+    '--budget': And(Use(float), lambda x: x > 0, error='--budget=<MB> must be a positive value.'),
+    '--warmup': And(Use(int), lambda n: n >= 0, error='--warmup=<n> must be a non-negative integer.'),
+    '--repeat': And(Use(int), lambda n: n > 0, error='--repeat=<n> must be a positive integer.'),
+    '--ci': And(Use(float), lambda x: x > 0, error='--ci=<frac> must be a positive value.'),
+    '--max-time': And(Use(float), lambda x: x >= 0, error='--max-time=<s> must be non-negative.'),
+    '--seed': Or(None, Use(int, error='--seed=<n> must be an integer.')),
+    '--cache': Or(None, Use(str)),
+    '--cache-size': Use(float, error='--cache-size=<MB> must be a floating point value.'),
     '--help': Or(None, Use(bool))
 })
@@ -0,0 +1,103 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Exact integer matrix multiplication using BLAS, NumPy does not use BLAS for
+# integer matrices, the products are computed as floating point values when
+# they are exact and accumulated as 64-bit integers, with overflow detection.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import numpy as np
+import scipy.sparse
+from docopt import docopt
+from helpers import kernel, time_kernel, report, usage, schema
+from schema import SchemaError
+
+# The largest integer below which every integer is exactly represented by a float64
+EXACT_FLOAT = 2**53
+
+# The largest integer that can be represented by an int64
+MAX_INT64 = 2**63 - 1
+
+
+def max_abs(X):
+    """Returns the largest absolute value of the dense or sparse matrix as an integer."""
+    if X.shape[0] == 0 or X.shape[1] == 0:
+        return 0
+    return max(abs(int(X.max())), abs(int(X.min())))
+
+
+def setup(A, B, args):
+    """Chooses how the integer matrices are multiplied exactly, and converts them
+    before timing as the benchmark measures the multiplication. Floating point
+    matrices are multiplied as they are, sparse matrices in CSR format with 64-bit
+    integers, and dense matrices as float64 using BLAS if the bound on every
+    partial sum is below 2^53, otherwise blocks of the inner dimension small
+    enough to be exact are multiplied as float64 and accumulated as 64-bit
+    integers. An OverflowError is raised if the product may overflow a 64-bit
+    integer.
+    """
+    if A.dtype.kind == 'f' or B.dtype.kind == 'f':
+        return 'dense', A, B, None
+
+    # The bound on the magnitude of every partial sum of the product
+    n, bound = A.shape[1], max_abs(A) * max_abs(B)
+    if n * bound > MAX_INT64:
+        raise OverflowError('The product may overflow a 64-bit integer, the bound is %d.' %
+                            (n * bound))
+
+    if scipy.sparse.issparse(A):
+        A = A.astype(np.int64)
+        B = B.astype(np.int64)
+        return 'csr', A, B, None
+    elif n * bound < EXACT_FLOAT:
+        return 'float', A.astype(np.float64), B.astype(np.float64), None
+    elif bound < EXACT_FLOAT:
+        return 'blocked', A.astype(np.float64), B.astype(np.float64), EXACT_FLOAT // bound
+    return 'int64', A.astype(np.int64), B.astype(np.int64), None
+
+
+@kernel(setup=setup, fmt='auto')
+def integer(route, A, B, block):
+    """Computes the exact integer matrix multiplication using the route chosen by
+    setup, the blocked route accumulates the float64 product of each block of
+    the inner dimension in a 64-bit integer matrix.
+    """
+    if route == 'csr':
+        return A.dot(B)
+    elif route == 'float':
+        return np.dot(A, B).astype(np.int64)
+    elif route == 'blocked':
+        C = np.zeros((A.shape[0], B.shape[1]), dtype=np.int64)
+        for k in range(0, A.shape[1], block):
+            C += np.dot(A[:, k:k+block], B[k:k+block, :]).astype(np.int64)
+        return C
+    # The floating point and 64-bit integer matrices are multiplied as they are
+    return A.dot(B)
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Calculate the execution time for the exact integer multiplication
+    report(time_kernel(__name__, args))
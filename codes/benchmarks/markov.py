@@ -0,0 +1,149 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Markov chain powers of stochastic matrices, computes the powers P^k for many
+# k by repeated squaring sharing the squares between the powers, or using the
+# eigendecomposition of P for large powers.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import numpy as np
+from docopt import docopt
+from helpers import clock, kernel, time_kernel, metrics, report, usage, schema
+from schema import SchemaError
+
+# The number of multiplications above which the auto route uses the
+# eigendecomposition, which costs about as much as this many multiplications
+EIGEN_PRODUCTS = 24
+
+
+def products(k):
+    """Returns the number of multiplications to compute P^k by repeated squaring."""
+    return k.bit_length() - 1 + bin(k).count('1') - 1
+
+
+def squaring_powers(P, ks):
+    """Returns the dictionary of the powers P^k for each k computed by repeated
+    squaring, the squares P^(2^j) are computed once and shared by every power.
+    Each power starts from the largest power already computed whose bits are a
+    subset of its own, and the buffers of the products are reused. The time of
+    each squaring step and of combining the squares are recorded as metrics.
+    """
+    squares = [P]
+    for j in range(1, max(ks).bit_length()):
+        start = clock()
+        squares.append(np.dot(squares[-1], squares[-1]))
+        metrics['square_%d' % j] = clock() - start
+
+    start = clock()
+    results, scratch = {}, np.empty_like(P)
+    for k in sorted(set(ks)):
+        bases = [c for c in results if c & k == c]
+        base = max(bases) if bases else 0
+        bits = [j for j in range(k.bit_length()) if (k & ~base) >> j & 1]
+        first = results[base] if base else squares[bits.pop(0)]
+        if not bits:
+            results[k] = first
+            continue
+
+        # The product is alternated between the buffer of the power and the scratch
+        # buffer, which is reused by the next power
+        result = np.empty_like(P)
+        np.dot(first, squares[bits[0]], out=result)
+        for j in bits[1:]:
+            np.dot(result, squares[j], out=scratch)
+            result, scratch = scratch, result
+        results[k] = result
+    metrics['combine'] = clock() - start
+    return results
+
+
+def eigen_powers(P, ks):
+    """Returns the dictionary of the powers P^k for each k computed from the
+    eigendecomposition P = V diag(w) V^-1 as V diag(w^k) V^-1, which requires P
+    to be diagonalizable. The time of the decomposition and of computing the
+    powers are recorded as metrics.
+    """
+    start = clock()
+    w, V = np.linalg.eig(P)
+    V_inv = np.linalg.inv(V)
+    metrics['eigen'] = clock() - start
+
+    start = clock()
+    results = {}
+    for k in sorted(set(ks)):
+        results[k] = np.dot(V * w**k, V_inv).real
+    metrics['combine'] = clock() - start
+    return results
+
+
+def power_error(results, A, B):
+    """Returns the largest relative error of the powers compared to the powers of
+    the transition matrix of A computed by np.linalg.matrix_power.
+    """
+    P = transition(A)
+    errors = []
+    for k, result in results.iteritems():
+        exact = np.linalg.matrix_power(P, k)
+        norm = np.linalg.norm(exact)
+        errors.append(np.linalg.norm(result - exact) / norm if norm > 0 else np.linalg.norm(result))
+    return max(errors)
+
+
+def transition(A):
+    """Returns the matrix with each row normalized to sum to 1, the transition
+    matrix of a Markov chain. The rows of the generated stochastic matrices only
+    sum to about 1, so their powers would slowly diverge.
+    """
+    P = np.array(A, dtype=np.float64)
+    sums = P.sum(axis=1)
+    P[sums != 0] /= sums[sums != 0, np.newaxis]
+    return P
+
+
+def setup(A, B, args):
+    """Creates the transition matrix P from A, B is not used, and chooses the route
+    for the powers given by --powers, the auto route uses the eigendecomposition
+    if repeated squaring requires more than EIGEN_PRODUCTS multiplications.
+    """
+    route = args['--route']
+    if route == 'auto':
+        route = 'eigen' if products(max(args['--powers'])) > EIGEN_PRODUCTS else 'squaring'
+    return transition(A), args['--powers'], route
+
+
+@kernel(setup=setup, error=power_error)
+def markov(P, ks, route):
+    """Computes the powers P^k of the stochastic matrix P for each k, returns the
+    dictionary of the powers.
+    """
+    if route == 'eigen':
+        return eigen_powers(P, ks)
+    return squaring_powers(P, ks)
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Calculate the execution time for the powers of the Markov chain
+    report(time_kernel(__name__, args))
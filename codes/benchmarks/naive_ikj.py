@@ -23,18 +23,19 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ###############################################################################
-from time import time
 from docopt import docopt
-from helpers import gen_matrix, usage, schema
+from helpers import kernel, time_kernel, report, empty_result, usage, schema
 from schema import SchemaError
 
 
+@kernel(setup=empty_result)
 def naive_ikj(A, B, C):
     """Computes the matrix multiplication using the naiive approach"""
     for i in range(A.shape[0]):
         for k in range(B.shape[1]):
             for j in range(A.shape[1]):
                 C[i, j] += A[i, k] * B[k, j]
+    return C
 
 
 if __name__ == '__main__':
@@ -44,14 +45,5 @@ if __name__ == '__main__':
     except SchemaError as e:
         exit(e)
 
-    # Generate the dynamic matrices for the test
-    dim, dtype, mtype = args['DIM'], args['--dtype'], args['--mtype']
-    A = gen_matrix(dim, dim, dtype, mtype)
-    B = gen_matrix(dim, dim, dtype, mtype)
-    C = gen_matrix(dim, dim, dtype, empty=True)
-
     # Calculate the execution time for the naive approach
-    start = time()
-    naive_ikj(A, B, C)
-    end = time()
-    print "%0.3f" % (end-start,)
+    report(time_kernel(__name__, args))
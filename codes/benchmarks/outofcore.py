@@ -0,0 +1,127 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Out-of-core blocked matrix multiplication, the tiles of the memory mapped
+# matrices A and B are read by a prefetching thread while the previous tiles
+# are multiplied, and the tiles of C are written to a memory mapped file.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import os
+import tempfile
+import numpy as np
+from threading import Thread
+from Queue import Queue
+from docopt import docopt
+from helpers import clock, kernel, time_kernel, phases, report, usage, schema
+from schema import SchemaError
+
+# The number of tiles in memory at once, a pair of tiles of A and B being read, a
+# pair queued, a pair being multiplied, the tile of C, and the product of the pair
+BUFFERS = 8
+
+
+def read_tiles(A, B, tiles, queue):
+    """Reads the tiles of A and B in the order they are multiplied into the queue,
+    which blocks until the previous tiles are taken. Errors are passed on through
+    the queue.
+    """
+    try:
+        for rows, cols, inner in tiles:
+            queue.put((np.array(A[rows, inner]), np.array(B[inner, cols])))
+    except Exception as e:
+        queue.put(e)
+
+
+def setup(A, B, args):
+    """Creates the memory mapped result matrix C in the directory of the matrix
+    store, otherwise the temporary directory, and chooses the largest tile size
+    for which the tiles in memory fit in the budget given by --budget. The file of
+    C is removed once mapped, so it is deleted when C is no longer used.
+    """
+    dtype = np.result_type(A, B)
+    itemsize = max(A.itemsize, B.itemsize, dtype.itemsize)
+    tile = max(1, int(np.sqrt(args['--budget'] * 2**20 / (BUFFERS * itemsize))))
+
+    fd, name = tempfile.mkstemp(prefix='matmul-', suffix='.dat',
+                                dir=args['--cache'] or tempfile.gettempdir())
+    os.close(fd)
+    C = np.memmap(name, dtype=dtype, mode='w+', shape=(A.shape[0], B.shape[1]))
+    os.remove(name)
+    return A, B, C, tile
+
+
+@kernel(setup=setup)
+def outofcore(A, B, C, tile):
+    """Computes the matrix multiplication tile by tile, each tile of C accumulates
+    the products of the tiles of A and B along the inner dimension in memory and
+    is then written to C. The time spent waiting for the tiles to be read and
+    multiplying them are recorded as the wait and compute phases. The tile of C
+    and the product of the tiles are preallocated so that no other tiles are
+    allocated while multiplying.
+    """
+    m, n, p = A.shape[0], A.shape[1], B.shape[1]
+    tiles = [(slice(i, i+tile), slice(j, j+tile), slice(k, k+tile))
+             for i in range(0, m, tile) for j in range(0, p, tile) for k in range(0, n, tile)]
+
+    queue = Queue(maxsize=1)
+    reader = Thread(target=read_tiles, args=(A, B, tiles, queue))
+    reader.daemon = True
+    reader.start()
+
+    # The tiles at the edges are smaller, the views of the start of the buffers
+    # are contiguous so that the products can be written into them
+    C_buf = np.empty(tile * tile, dtype=C.dtype)
+    P_buf = np.empty(tile * tile, dtype=C.dtype)
+
+    wait = compute = 0.0
+    for rows, cols, inner in tiles:
+        start = clock()
+        item = queue.get()
+        wait += clock() - start
+        if isinstance(item, Exception):
+            raise item
+
+        start = clock()
+        A_t, B_t = item
+        shape = (A_t.shape[0], B_t.shape[1])
+        if inner.start == 0:
+            C_t = np.dot(A_t, B_t, out=C_buf[:shape[0] * shape[1]].reshape(shape))
+        else:
+            C_t += np.dot(A_t, B_t, out=P_buf[:shape[0] * shape[1]].reshape(shape))
+        if inner.start + tile >= n:
+            C[rows, cols] = C_t
+        compute += clock() - start
+
+    reader.join()
+    C.flush()
+    phases['wait'] = wait
+    phases['compute'] = compute
+    return C
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Calculate the execution time for the out-of-core approach
+    report(time_kernel(__name__, args))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Shared memory parallel implementation using a pool of processes on a single
+# machine, the matrices are stored in a shared memory segment and each process
+# computes its panel of rows directly into the result without any copies.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import os
+import atexit
+import tempfile
+import numpy as np
+from os import path
+from multiprocessing import Pool
+from docopt import docopt
+from helpers import kernel, time_kernel, report, split, usage, schema
+from schema import SchemaError
+
+# The directory of the shared memory segments, in memory if available
+SHM_DIR = '/dev/shm' if path.isdir('/dev/shm') else tempfile.gettempdir()
+
+# The alignment in bytes of each matrix in the segment
+ALIGN = 64
+
+# The pool of processes and the segment, reused for every multiplication
+_pool = None
+_segment = None
+
+
+class Segment(object):
+    """A file backed shared memory segment containing the matrices A, B, and C
+    which is mapped by the master and each process of the pool. The segment is
+    created if no name is given, and removed when closed by its creator.
+    """
+
+    def __init__(self, layout, name=None):
+        """Maps the segment with the layout, a list of (shape, dtype) of each matrix."""
+        self.layout = layout
+        self.offsets = [0]
+        for shape, dtype in layout:
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            self.offsets.append(self.offsets[-1] + -(-size // ALIGN) * ALIGN)
+
+        self.owner = name is None
+        if self.owner:
+            fd, name = tempfile.mkstemp(prefix='matmul-', dir=SHM_DIR)
+            os.ftruncate(fd, max(self.offsets[-1], 1))
+            os.close(fd)
+        self.name = name
+        self.arrays = [np.memmap(name, dtype=dtype, mode='r+', offset=offset, shape=shape)
+                       .view(np.ndarray) for (shape, dtype), offset in zip(layout, self.offsets)]
+
+    def close(self):
+        """Unmaps the segment, and removes it if this is the creator."""
+        self.arrays = []
+        if self.owner and path.exists(self.name):
+            os.remove(self.name)
+
+
+def compute_panel(task):
+    """Computes the panel of rows of C in a process of the pool, the segment is
+    mapped on the first task of each multiplication.
+    """
+    global _segment
+    name, layout, start, stop = task
+    if _segment is None or _segment.name != name:
+        _segment = Segment(layout, name)
+    A, B, C = _segment.arrays
+    np.dot(A[start:stop], B, out=C[start:stop])
+
+
+def close():
+    """Stops the pool and removes the segment."""
+    global _pool, _segment
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+    if _segment is not None:
+        _segment.close()
+        _segment = None
+
+atexit.register(close)
+
+
+def setup(A, B, args):
+    """Copies A and B into the shared memory segment, which is only created again
+    if the matrices change shape or type, and starts the pool of processes if it
+    is not already running with the number of processes.
+    """
+    global _pool, _segment
+    procs = args['--procs']
+    layout = [(A.shape, A.dtype.str), (B.shape, B.dtype.str),
+              ((A.shape[0], B.shape[1]), np.result_type(A, B).str)]
+    if _pool is None or _pool._processes != procs:
+        close()
+        _pool = Pool(procs)
+    if _segment is None or _segment.layout != layout:
+        if _segment is not None:
+            _segment.close()
+        _segment = Segment(layout)
+
+    _segment.arrays[0][...] = A
+    _segment.arrays[1][...] = B
+    counts, starts = split(A.shape[0], procs)
+    tasks = [(_segment.name, layout, start, start + count)
+             for count, start in zip(counts, starts) if count > 0]
+    return _pool, tasks, _segment.arrays[2]
+
+
+@kernel(setup=setup)
+def shared_parallel(pool, tasks, C):
+    """Computes the matrix multiplication with each process of the pool computing
+    a panel of rows of C in the shared memory segment.
+    """
+    pool.map(compute_panel, tasks, chunksize=1)
+    return C
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Calculate the execution time for the shared memory parallel approach
+    report(time_kernel(__name__, args))
@@ -25,20 +25,26 @@
 import numpy as np
 from mpi4py import MPI
 from docopt import docopt
-from helpers import gen_matrix, gen_vector, usage, schema
+from helpers import clock, gen_operands, matrix_dtype, split, phases, report, checksum,\
+    usage, schema
 from schema import SchemaError
 
 # Define process 0 as MASTER
 MASTER = 0
 
 
-def master(dim, dtype, mtype, n_proc, comm):
+def mpi_type(A):
+    """Returns the MPI datatype of the numpy matrix."""
+    return MPI._typedict[A.dtype.char]
+
+
+def master(args, n_proc, comm):
     """The master process, generates matrices and divides up the work."""
-    A = gen_matrix(dim, dim, dtype, mtype)
-    B = gen_matrix(dim, dim, dtype, mtype)
-    C = gen_matrix(dim, dim, dtype, empty=True)
-    ANS = gen_vector(dim, dtype, empty=True)
-    n_rows = dim
+    dim, mode = args['DIM'], args['--mode']
+    start = clock()
+    A, B = gen_operands(args, mmap=False)
+    phases['generation'] = clock() - start
+    C = np.zeros((dim, dim), dtype=np.result_type(A, B))
 
     # Start the runtime clock
     t_start = MPI.Wtime()
@@ -46,53 +52,197 @@ def master(dim, dtype, mtype, n_proc, comm):
     # Broadcast the second matrix to all processes
     comm.Bcast(B, MASTER)
 
-    # Send the first rows to other processes
+    if mode == 'static':
+        static(A, B, C, n_proc, comm)
+    elif mode == 'pipelined':
+        pipelined_master(A, B, C, args['--rows'], args['--master-share'], n_proc, comm)
+    else:
+        dynamic_master(A, C, args['--rows'], n_proc, comm)
+
+    report(MPI.Wtime() - t_start, checksum=checksum(C))
+
+
+def dynamic_master(A, C, rows, n_proc, comm):
+    """Sends panels of rows of A to the processes as they become idle and records
+    the product of each panel with B they return.
+    """
+    n_rows, dim = A.shape
+    ANS = np.empty((rows, dim), dtype=C.dtype)
+
+    # Send the first panels of rows to other processes
     n_sent = 0
-    for k in range(1, min(n_rows+1, n_proc)):
-        comm.Send(A[n_sent, :], k, tag=n_sent)
-        n_sent += 1
+    for k in range(1, n_proc):
+        if n_sent >= n_rows:
+            comm.Send(ANS[:0], k, tag=n_rows+1)
+            continue
+        comm.Send(A[n_sent:n_sent+rows], k, tag=n_sent)
+        n_sent += rows
 
-    # Loop and receive the dot product from the processes
-    for k in range(n_rows):
+    # Loop and receive the products of the panels from the processes
+    n_recv = 0
+    while n_recv < n_rows:
         status = MPI.Status()
-        # Receive a computed vector product of that row
+        # Receive a computed product of the panel
         comm.Recv(ANS, source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=status)
         sender = status.source
         row = status.tag
+        count = status.Get_count(mpi_type(ANS)) // dim
         # Record the results
-        C[row, :] = ANS
+        C[row:row+count] = ANS[:count]
+        n_recv += count
 
-        # Either send another row to sender or a tag to signal completion
+        # Either send another panel to sender or a tag to signal completion
         if n_sent < n_rows:
-            comm.Send(A[n_sent, :], sender, tag=n_sent)
-            n_sent += 1
+            comm.Send(A[n_sent:n_sent+rows], sender, tag=n_sent)
+            n_sent += rows
         else:
-            comm.Send(gen_vector(dim, dtype, empty=True), sender, tag=n_rows+1)
+            comm.Send(ANS[:0], sender, tag=n_rows+1)
+
 
-    print "%0.3f" % (MPI.Wtime() - t_start)
+def pipelined_master(A, B, C, rows, share, n_proc, comm):
+    """Keeps two panels of rows of A in flight to each process so they always have
+    the next panel while computing the current one. The receives of the products
+    are posted ahead, two for each process, and as each product arrives another
+    panel is sent to the process. When share is True the master computes a panel
+    itself whenever no product has arrived.
+    """
+    n_rows, dim = A.shape
+    ANS = [np.empty((rows, dim), dtype=C.dtype) for i in range(2 * (n_proc - 1))]
+    done = np.empty((0, dim), dtype=C.dtype)
+    sends = []
+    n_sent, n_done = 0, 0
+
+    def send(k):
+        """Sends the next panel to process k, or a tag to signal completion."""
+        if n_sent < n_rows:
+            sends.append(comm.Isend(A[n_sent:n_sent+rows], k, tag=n_sent))
+            return rows
+        sends.append(comm.Isend(done, k, tag=n_rows+1))
+        return 0
+
+    # Send the first two panels to each process and post the receives of the products
+    recvs = []
+    for i in range(len(ANS)):
+        k = i // 2 + 1
+        sent = send(k)
+        recvs.append(comm.Irecv(ANS[i], source=k) if sent else MPI.REQUEST_NULL)
+        n_sent += sent
+
+    while n_done < n_rows:
+        status = MPI.Status()
+        if share and n_sent < n_rows:
+            i, arrived = MPI.Request.Testany(recvs, status)
+            if not arrived:
+                # Compute the next panel while the processes are busy
+                C[n_sent:n_sent+rows] = np.dot(A[n_sent:n_sent+rows], B)
+                n_done += min(rows, n_rows - n_sent)
+                n_sent += rows
+                continue
+        else:
+            i = MPI.Request.Waitany(recvs, status)
+
+        # Record the results, and send another panel to the process
+        row = status.tag
+        count = status.Get_count(mpi_type(ANS[i])) // dim
+        C[row:row+count] = ANS[i][:count]
+        n_done += count
+        sent = send(i // 2 + 1)
+        recvs[i] = comm.Irecv(ANS[i], source=i // 2 + 1) if sent else MPI.REQUEST_NULL
+        n_sent += sent
 
+    # Signal completion to the processes, each has two receives posted
+    for i in range(len(ANS)):
+        if recvs[i] != MPI.REQUEST_NULL:
+            recvs[i].Wait()
+            send(i // 2 + 1)
+    MPI.Request.Waitall(sends)
 
-def slave(dim, dtype, proc_id, comm):
+
+def static(A, B, C, n_proc, comm):
+    """Scatters an even share of the rows of A to every process, including the
+    master, and gathers the products of the shares into C.
+    """
+    n_rows, dim = B.shape
+    counts, starts = split(n_rows, n_proc)
+    rank = comm.Get_rank()
+    my_rows = np.empty((counts[rank], dim), dtype=B.dtype)
+
+    counts = [c * dim for c in counts]
+    starts = [s * dim for s in starts]
+    if A is None:
+        comm.Scatterv(None, my_rows, MASTER)
+    else:
+        comm.Scatterv([A, counts, starts, mpi_type(A)], my_rows, MASTER)
+
+    my_ans = np.dot(my_rows, B)
+    if C is None:
+        comm.Gatherv(my_ans, None, MASTER)
+    else:
+        comm.Gatherv(my_ans, [C, counts, starts, mpi_type(C)], MASTER)
+
+
+def slave(args, proc_id, comm):
     """The slave process, computes the matrix product and returns results."""
-    my_row = gen_vector(dim, dtype, empty=True)
-    B = gen_matrix(dim, dim, dtype, empty=True)
+    dim, mode = args['DIM'], args['--mode']
+    B = np.empty((dim, dim), dtype=matrix_dtype(args['--dtype'], args['--mtype']))
     n_rows = dim
     # Receive the second matrix
     comm.Bcast(B, MASTER)
 
-    # Receive the subset of the first matrix
+    if mode == 'static':
+        static(None, B, None, comm.Get_size(), comm)
+        return
+    elif mode == 'pipelined':
+        pipelined_slave(B, args['--rows'], comm)
+        return
+
+    # Receive the panels of the first matrix
+    my_rows = np.empty((args['--rows'], dim), dtype=B.dtype)
     status = MPI.Status()
-    comm.Recv(my_row, source=MASTER, tag=MPI.ANY_TAG, status=status)
+    comm.Recv(my_rows, source=MASTER, tag=MPI.ANY_TAG, status=status)
     row = status.tag
 
     while row < n_rows:
-        # Return the results, including the index of the row computed
-        comm.Send(np.dot(my_row, B), MASTER, tag=status.tag)
+        # Return the results, including the index of the first row computed
+        count = status.Get_count(mpi_type(my_rows)) // dim
+        comm.Send(np.dot(my_rows[:count], B), MASTER, tag=row)
         status = MPI.Status()
-        comm.Recv(my_row, source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=status)
+        comm.Recv(my_rows, source=MPI.ANY_SOURCE, tag=MPI.ANY_TAG, status=status)
         row = status.tag
 
 
+def pipelined_slave(B, rows, comm):
+    """Computes the products of the panels with two receives always posted, so the
+    next panel arrives while computing the current one. The products are sent
+    without blocking from two alternating buffers.
+    """
+    n_rows, dim = B.shape
+    panels = [np.empty((rows, dim), dtype=B.dtype) for i in range(2)]
+    products = [np.empty((rows, dim), dtype=B.dtype) for i in range(2)]
+    recvs = [comm.Irecv(panels[i], source=MASTER) for i in range(2)]
+    sends = [MPI.REQUEST_NULL, MPI.REQUEST_NULL]
+
+    cur = 0
+    while True:
+        status = MPI.Status()
+        recvs[cur].Wait(status)
+        row = status.tag
+        if row >= n_rows:
+            break
+        count = status.Get_count(mpi_type(panels[cur])) // dim
+
+        # Wait for the previous product sent from the buffer before reusing it
+        sends[cur].Wait()
+        np.dot(panels[cur][:count], B, out=products[cur][:count])
+        sends[cur] = comm.Isend(products[cur][:count], MASTER, tag=row)
+        recvs[cur] = comm.Irecv(panels[cur], source=MASTER)
+        cur ^= 1
+
+    # The other receive posted is also a signal of completion
+    recvs[cur ^ 1].Wait()
+    MPI.Request.Waitall(sends)
+
+
 if __name__ == '__main__':
     args = docopt(usage)
     try:
@@ -100,8 +250,6 @@ if __name__ == '__main__':
     except SchemaError as e:
         exit(e)
 
-    dim, dtype, mtype = args['DIM'], args['--dtype'], args['--mtype']
-
     # Initialize MPI environment
     comm = MPI.COMM_WORLD
     n_proc = comm.Get_size()
@@ -114,6 +262,6 @@ if __name__ == '__main__':
     comm.Barrier()
 
     if proc_id == MASTER:
-        master(dim, dtype, mtype, n_proc, comm)
+        master(args, n_proc, comm)
     else:
-        slave(dim, dtype, proc_id, comm)
+        slave(args, proc_id, comm)
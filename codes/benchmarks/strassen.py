@@ -0,0 +1,128 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Strassen-Winograd recursive matrix multiplication, which requires seven
+# rather than eight multiplications of the quadrants at each level and uses
+# np.dot once the dimensions of the quadrants are below the cutover.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import numpy as np
+from docopt import docopt
+from helpers import kernel, time_kernel, report, usage, schema
+from schema import SchemaError
+
+
+def padded_size(n, cutover):
+    """Returns the smallest dimension of the form c * 2^levels with c <= cutover
+    that the matrices are padded to, and the number of levels of recursion.
+    """
+    levels = 0
+    while -(-n // 2**levels) > cutover:
+        levels += 1
+    return -(-n // 2**levels) * 2**levels, levels
+
+
+class Workspace(object):
+    """The padded matrices and the scratch buffers for each level of recursion,
+    which are allocated once and reused for every multiplication.
+    """
+
+    def __init__(self, m, n, p, dtype, cutover):
+        size, levels = padded_size(max(m, n, p), cutover)
+        self.A = np.zeros((size, size), dtype=dtype)
+        self.B = np.zeros((size, size), dtype=dtype)
+        self.C = np.zeros((size, size), dtype=dtype)
+        self.levels = []
+        for level in range(1, levels + 1):
+            h = size // 2**level
+            self.levels.append([np.empty((h, h), dtype=dtype) for i in range(3)])
+        h = size // 2**levels
+        self.leaf = np.empty((h, h), dtype=dtype)
+
+
+def winograd(A, B, C, work, level=0):
+    """Computes C = A * B using the Strassen-Winograd algorithm with the schedule
+    of seven products and fifteen additions, using the quadrants of C and the
+    scratch buffers X, Y, and M of the level for all the intermediate results.
+    """
+    if level == len(work.levels):
+        C[...] = np.dot(A, B, out=work.leaf)
+        return
+
+    X, Y, M = work.levels[level]
+    h = A.shape[0] // 2
+    A11, A12, A21, A22 = A[:h, :h], A[:h, h:], A[h:, :h], A[h:, h:]
+    B11, B12, B21, B22 = B[:h, :h], B[:h, h:], B[h:, :h], B[h:, h:]
+    C11, C12, C21, C22 = C[:h, :h], C[:h, h:], C[h:, :h], C[h:, h:]
+
+    np.subtract(A11, A21, out=X)
+    np.subtract(B22, B12, out=Y)
+    winograd(X, Y, C21, work, level + 1)  # P7 = (A11 - A21)(B22 - B12)
+    np.add(A21, A22, out=X)
+    np.subtract(B12, B11, out=Y)
+    winograd(X, Y, C22, work, level + 1)  # P5 = (A21 + A22)(B12 - B11)
+    np.subtract(X, A11, out=X)
+    np.subtract(B22, Y, out=Y)
+    winograd(X, Y, C12, work, level + 1)  # P6 = S2 T2
+    np.subtract(A12, X, out=X)
+    winograd(A11, B11, C11, work, level + 1)  # P1 = A11 B11
+
+    C12 += C11  # U2 = P1 + P6
+    C21 += C12  # U3 = U2 + P7
+    C12 += C22  # U4 = U2 + P5
+    C22 += C21  # U7 = U3 + P5
+
+    winograd(X, B22, M, work, level + 1)  # P3 = S4 B22
+    C12 += M  # U5 = U4 + P3
+    np.subtract(Y, B21, out=Y)
+    winograd(A22, Y, M, work, level + 1)  # P4 = A22 T4
+    C21 -= M  # U6 = U3 - P4
+    winograd(A12, B21, M, work, level + 1)  # P2 = A12 B21
+    C11 += M  # U1 = P1 + P2
+
+
+def setup(A, B, args):
+    """Allocates the workspace for the dimensions of A and B and the cutover."""
+    work = Workspace(A.shape[0], A.shape[1], B.shape[1], np.result_type(A, B), args['--cutover'])
+    return A, B, work
+
+
+@kernel(setup=setup, verify=True)
+def strassen(A, B, work):
+    """Computes the matrix multiplication using the Strassen-Winograd algorithm,
+    the matrices are padded with zeros to the size of the workspace.
+    """
+    m, n, p = A.shape[0], A.shape[1], B.shape[1]
+    work.A[:m, :n] = A
+    work.B[:n, :p] = B
+    winograd(work.A, work.B, work.C, work)
+    return work.C[:m, :p]
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Calculate the execution time for the Strassen-Winograd approach, and the
+    # error compared to the baseline for float matrices
+    report(time_kernel(__name__, args))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Distributed matrix multiplication using the SUMMA algorithm on a 2D grid of
+# processes, where each process only holds its blocks of A, B, and C.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import sys
+import numpy as np
+from mpi4py import MPI
+from docopt import docopt
+from helpers import clock, gen_operands, gen_block, split, phases, report, checksum, usage,\
+    schema
+from schema import SchemaError
+
+# Define process 0 as MASTER
+MASTER = 0
+
+
+class Grid(object):
+    """The q x q Cartesian grid of processes, with the communicators of the row
+    and the column of the grid containing the process.
+    """
+
+    def __init__(self, comm):
+        self.q = int(round(np.sqrt(comm.Get_size())))
+        self.comm = comm.Create_cart([self.q, self.q], periods=[False, False])
+        self.row, self.col = self.comm.Get_coords(self.comm.Get_rank())
+        # The processes in the same row, ranked by column, and the same column
+        self.row_comm = self.comm.Sub([False, True])
+        self.col_comm = self.comm.Sub([True, False])
+
+
+def local_blocks(args, grid):
+    """Returns the blocks of A and B of the process, and the number of rows and
+    columns of each block row and block column of the grid. Only the blocks are
+    generated, or read from the memory maps when the matrices are stored, from
+    the seed of the master so that the blocks are those of the same matrices.
+    """
+    seed = args['--seed']
+    if seed is None:
+        seed = np.random.randint(2**31) if grid.comm.Get_rank() == MASTER else None
+        seed = grid.comm.bcast(seed, root=MASTER)
+    counts, starts = split(args['DIM'], grid.q)
+    rows = slice(starts[grid.row], starts[grid.row] + counts[grid.row])
+    cols = slice(starts[grid.col], starts[grid.col] + counts[grid.col])
+
+    if args['--cache'] is not None:
+        A, B = gen_operands(dict(args, **{'--seed': seed}))
+        return np.array(A[rows, cols]), np.array(B[rows, cols]), counts
+
+    dim, dtype, mtype = args['DIM'], args['--dtype'], args['--mtype']
+    params = dict(dist=args['--dist'], sparse=args['--sparse'])
+    A = gen_block(dim, dim, rows, cols, dtype, mtype, seed=[seed, 0], **params)
+    B = gen_block(dim, dim, rows, cols, dtype, mtype, seed=[seed, 1], **params)
+    return A, B, counts
+
+
+def summa(A, B, counts, grid):
+    """Computes the block of C of the process, at each step k the processes in
+    column k of the grid broadcast their block of A along their row, and the
+    processes in row k broadcast their block of B along their column. Returns
+    the block of C and the communication and computation times.
+    """
+    C = np.zeros((A.shape[0], B.shape[1]), dtype=np.result_type(A, B))
+    A_k = np.empty(A.shape[0] * max(counts), dtype=A.dtype)
+    B_k = np.empty(max(counts) * B.shape[1], dtype=B.dtype)
+    t_comm, t_comp = 0.0, 0.0
+
+    for k in range(grid.q):
+        # The panels are views of the start of the contiguous buffers
+        t_start = MPI.Wtime()
+        A_panel = A_k[:A.shape[0] * counts[k]].reshape(A.shape[0], counts[k])
+        B_panel = B_k[:counts[k] * B.shape[1]].reshape(counts[k], B.shape[1])
+        if grid.col == k:
+            A_panel[...] = A
+        if grid.row == k:
+            B_panel[...] = B
+        grid.row_comm.Bcast(A_panel, k)
+        grid.col_comm.Bcast(B_panel, k)
+        t_comm += MPI.Wtime() - t_start
+
+        t_start = MPI.Wtime()
+        C += np.dot(A_panel, B_panel)
+        t_comp += MPI.Wtime() - t_start
+
+    return C, t_comm, t_comp
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Initialize MPI environment
+    comm = MPI.COMM_WORLD
+    n_proc = comm.Get_size()
+    proc_id = comm.Get_rank()
+
+    if int(round(np.sqrt(n_proc)))**2 != n_proc:
+        if proc_id == MASTER:
+            print "Error: requires a square number of processes to operate!"
+        sys.exit(1)
+
+    grid = Grid(comm)
+    start = clock()
+    A, B, counts = local_blocks(args, grid)
+    t_gen = clock() - start
+
+    # Ensure all processes have started before benchmarking
+    comm.Barrier()
+    t_start = MPI.Wtime()
+    C, t_comm, t_comp = summa(A, B, counts, grid)
+    t_total = MPI.Wtime() - t_start
+
+    # The runtime of the slowest process, and its generation, communication and
+    # computation, along with the checksum of the blocks of C
+    t_total = comm.reduce(t_total, op=MPI.MAX, root=MASTER)
+    t_gen = comm.reduce(t_gen, op=MPI.MAX, root=MASTER)
+    t_comm = comm.reduce(t_comm, op=MPI.MAX, root=MASTER)
+    t_comp = comm.reduce(t_comp, op=MPI.MAX, root=MASTER)
+    total = comm.reduce(checksum(C), op=MPI.SUM, root=MASTER)
+    if proc_id == MASTER:
+        phases['generation'] = t_gen
+        phases['communication'] = t_comm
+        phases['compute'] = t_comp
+        report(t_total, checksum=total)
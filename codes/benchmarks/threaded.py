@@ -0,0 +1,96 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Threaded tiled implementation using a pool of threads, NumPy releases the GIL
+# while BLAS computes the product of each tile, so the threads compute the
+# tiles of the result concurrently from views of the matrices.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import atexit
+import numpy as np
+from math import ceil
+from multiprocessing.pool import ThreadPool
+from docopt import docopt
+from helpers import kernel, time_kernel, report, usage, schema
+from schema import SchemaError
+
+# The largest default size of the tiles of C computed by each task
+TILE = 256
+
+# The pool of threads, reused for every multiplication
+_pool = None
+
+
+def close():
+    """Stops the pool of threads."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool.join()
+        _pool = None
+
+atexit.register(close)
+
+
+def setup(A, B, args):
+    """Creates the empty result matrix C and the tiles of C given by --tile, by
+    default at most TILE and small enough that there are at least as many rows
+    and columns of tiles as threads, and starts the pool if it is not already
+    running with the number of threads.
+    """
+    global _pool
+    threads = args['--threads']
+    if _pool is None or _pool._processes != threads:
+        close()
+        _pool = ThreadPool(threads)
+
+    tile = args['--tile']
+    if tile is None:
+        tile = max(1, min(TILE, int(ceil(min(A.shape[0], B.shape[1]) / float(threads)))))
+    C = np.zeros((A.shape[0], B.shape[1]), dtype=np.result_type(A, B))
+    tiles = [(slice(i, i+tile), slice(j, j+tile))
+             for i in range(0, C.shape[0], tile) for j in range(0, C.shape[1], tile)]
+    return _pool, A, B, C, tiles
+
+
+@kernel(setup=setup)
+def threaded(pool, A, B, C, tiles):
+    """Computes the matrix multiplication with each thread of the pool computing
+    a tile of C from a panel of rows of A and a panel of columns of B. Only the
+    floating point products are computed by BLAS without the GIL, the integer
+    products are computed by NumPy and are effectively serialized.
+    """
+    def compute_tile(tile):
+        rows, cols = tile
+        C[rows, cols] = np.dot(A[rows], B[:, cols])
+
+    pool.map(compute_tile, tiles, chunksize=1)
+    return C
+
+
+if __name__ == '__main__':
+    args = docopt(usage)
+    try:
+        args = schema.validate(args)
+    except SchemaError as e:
+        exit(e)
+
+    # Calculate the execution time for the threaded approach
+    report(time_kernel(__name__, args))
@@ -0,0 +1,219 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# The append-only store of the results of the trials of the test plans, every
+# trial is recorded as a line of JSON as soon as it finishes so that the test
+# plan can be resumed if it is interrupted.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import sys
+import json
+import socket
+import hashlib
+import platform
+from time import time
+from subprocess import check_output
+from multiprocessing import cpu_count
+from collections import OrderedDict
+
+
+def plan_hash(testplan):
+    """Returns the hash of the benchmarks and tests of the test plan, which define
+    the trials, the number of trials of each test may change between runs.
+    """
+    plan = {'benchmarks': testplan['benchmarks'], 'tests': testplan['tests']}
+    return hashlib.sha1(json.dumps(plan, sort_keys=True)).hexdigest()
+
+
+# Prints the versions of NumPy and SciPy and the BLAS libraries as JSON
+LIBRARIES = """
+import json, numpy, scipy
+try:
+    blas = numpy.__config__.get_info('blas_opt_info').get('libraries', [])
+except Exception:
+    blas = []
+print json.dumps({'numpy': numpy.__version__, 'scipy': scipy.__version__, 'blas': blas})
+"""
+
+
+def environment():
+    """Returns a description of the software and hardware the trials execute on.
+    The libraries are described by a separate interpreter, since importing NumPy
+    in the test framework sets the number of BLAS threads of the workers.
+    """
+    env = OrderedDict([('python', platform.python_version()),
+                       ('platform', platform.platform()),
+                       ('processor', platform.processor() or platform.machine()),
+                       ('cpus', cpu_count())])
+    try:
+        libraries = json.loads(check_output([sys.executable, '-c', LIBRARIES]))
+    except Exception:
+        libraries = {}
+    for name in ['numpy', 'scipy', 'blas']:
+        env[name] = libraries.get(name)
+    return env
+
+
+def read_records(file, plan=None, host=None):
+    """Returns an iterator of the records in the results file, optionally only those
+    of the test plan hash and host. The records are read one at a time so that the
+    memory used does not grow with the file, a record that is incomplete as the
+    test plan was interrupted while writing it is skipped.
+    """
+    with open(file, 'r') as fp:
+        for line in fp:
+            try:
+                record = json.loads(line, object_pairs_hook=OrderedDict)
+            except ValueError:
+                continue
+            if (plan is None or record['plan'] == plan) and\
+                    (host is None or record['host'] == host):
+                yield record
+
+
+def trial_times(file):
+    """Returns the execution time of each trial in the results file for each
+    benchmark, test and dimension, in the order they were recorded. The time of
+    a trial is the median of the times of its runs, or the execution time of the
+    trial if they were not recorded, since the runs of a trial are not
+    independent of each other. The trials that failed are excluded.
+    """
+    import numpy as np
+    times = OrderedDict()
+    for record in read_records(file):
+        if record.get('error'):
+            continue
+        key = (record['benchmark'], record['test'], str(record['dim']))
+        times.setdefault(key, []).append(float(np.median(record.get('times') or
+                                                         [record['time']])))
+    return times
+
+
+def significance(baseline, candidate):
+    """Returns the p-value of the two-sided Mann-Whitney U test that the execution
+    times of the baseline and candidate trials have the same distribution, which
+    unlike the t-test does not assume the times are normal and is robust to the
+    outliers of a noisy machine. There is no evidence of a difference when either
+    has a single trial or all of the times are identical.
+    """
+    from scipy.stats import mannwhitneyu
+    if len(baseline) < 2 or len(candidate) < 2:
+        return 1.0
+    try:
+        return mannwhitneyu(baseline, candidate, alternative='two-sided')[1]
+    except ValueError:
+        return 1.0
+
+
+def smallest_p(n1, n2):
+    """Returns the smallest p-value of significance for the numbers of trials,
+    that of trials which are entirely separated.
+    """
+    return significance(range(n1), range(n1, n1 + n2))
+
+
+def compare(baseline, candidate, threshold=0.05, alpha=0.05):
+    """Compares the execution times of the trials of two results files given by
+    trial_times, for each benchmark, test and dimension of both. The speedup is
+    the ratio of the median time of the baseline to the candidate, a regression
+    is a speedup below 1 / (1 + threshold) that is significant at the level
+    alpha, and an improvement is a speedup above 1 + threshold that is
+    significant. The comparisons with too few trials to ever be significant at the
+    level alpha are insufficient. Returns the columns of the report, and the
+    number of regressions and insufficient comparisons.
+    """
+    report = OrderedDict((column, []) for column in
+                         ['benchmarks', 'tests', 'dims', 'baseline', 'candidate',
+                          'trials', 'speedup', 'p-value', 'change'])
+    import numpy as np
+    regressions, insufficient = 0, 0
+    for key in baseline:
+        if key not in candidate:
+            continue
+        old, new = np.median(baseline[key]), np.median(candidate[key])
+        speedup = old / new if new > 0 else np.inf
+        p = significance(baseline[key], candidate[key])
+
+        change = ''
+        if smallest_p(len(baseline[key]), len(candidate[key])) >= alpha:
+            change = 'insufficient'
+            insufficient += 1
+        elif p < alpha and speedup < 1.0 / (1.0 + threshold):
+            change = 'regression'
+            regressions += 1
+        elif p < alpha and speedup > 1.0 + threshold:
+            change = 'improvement'
+
+        for column, value in zip(report, key + (old, new, '%d/%d' % (
+                len(baseline[key]), len(candidate[key])), speedup, p, change)):
+            report[column].append(value)
+    return report, regressions, insufficient
+
+
+class ResultStore(object):
+    """An append-only file of the results of every trial as lines of JSON. Each
+    record contains the hash of the test plan, the host, the environment, the
+    benchmark, test, parameters of the matrices, dimension and trial, along with
+    the execution time and metrics of the trial.
+    """
+
+    def __init__(self, file):
+        """Opens the store in the file, which is created if it does not exist."""
+        self.file = file
+        self.host = socket.gethostname()
+        self.env = environment()
+        self._fp = open(file, 'a+')
+
+        # The last record is incomplete if the test plan was interrupted while writing
+        # it, it is ended so that the records appended are not lost as well
+        self._fp.seek(0, 2)
+        if self._fp.tell() > 0:
+            self._fp.seek(-1, 2)
+            if self._fp.read(1) != '\n':
+                self._fp.seek(0, 2)
+                self._fp.write('\n')
+
+    def records(self, plan=None, host=None):
+        """Returns an iterator of the records in the store, optionally only those of
+        the test plan hash and host. The records are read one at a time so that the
+        memory used does not grow with the store, a record that is incomplete as
+        the test plan was interrupted while writing it is skipped.
+        """
+        self._fp.flush()
+        return read_records(self.file, plan, host)
+
+    def append(self, plan, benchmark, test, dim, trial, runtime, metrics, **params):
+        """Appends the record of the trial to the store, the parameters are the
+        properties of the test and benchmark such as the data type of the matrices,
+        and the checksum of the result or the error if the trial failed.
+        """
+        record = OrderedDict([('plan', plan), ('host', self.host), ('recorded', time()),
+                              ('benchmark', benchmark), ('test', test), ('dim', dim),
+                              ('trial', trial)])
+        record.update(sorted(params.items()))
+        record['time'] = runtime
+        record['metrics'] = metrics
+        record['env'] = self.env
+        self._fp.write(json.dumps(record) + '\n')
+        self._fp.flush()
+
+    def close(self):
+        """Closes the store."""
+        self._fp.close()
@@ -0,0 +1,544 @@
+#!/usr/bin/env python2
+###############################################################################
+#
+# Executes the trials of the benchmarks for the test framework, either
+# in-process using a long-lived worker or as a separate process, scheduling
+# the trials concurrently across the cores of the machine.
+#
+# Copyright (C) 2015, Jonathan Gillett
+# All rights reserved.
+#
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+###############################################################################
+import os
+import sys
+import json
+import atexit
+import signal
+import tempfile
+from os import path, devnull
+from time import time
+from threading import Thread, Condition, Event, Lock
+from Queue import Queue
+from distutils.spawn import find_executable
+from multiprocessing import Process, Pipe, cpu_count
+from subprocess import Popen, PIPE, call
+from schema import Schema, And, Or, Use, Optional, SchemaError
+
+# The commands used to set the CPU affinity and find child processes, if available
+TASKSET = find_executable('taskset')
+PGREP = find_executable('pgrep')
+
+# The environment variables that set the number of threads used by BLAS libraries
+BLAS_THREADS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+# The environment variable of the file the benchmarks write their report to, and
+# the version of the report, see helpers.report
+REPORT = 'BENCHMARK_REPORT'
+PROTOCOL = 1
+
+# The schema of the report of a trial, the execution time and the times of each
+# run of the kernel, the time of each phase such as the generation of the
+# matrices, communication and computation, the metrics, and the checksum of the
+# result
+number = Or(int, long, float)
+message = Schema({
+    'version': And(int, lambda v: v == PROTOCOL, error='unsupported report version'),
+    'time': And(number, lambda t: t >= 0, Use(float), error='time must be non-negative'),
+    Optional('times'): [And(number, lambda t: t >= 0, error='times must be non-negative')],
+    'phases': {Optional(basestring): And(number, lambda t: t >= 0,
+                                         error='phases must be non-negative times')},
+    'metrics': {Optional(basestring): Or(number, error='metrics must be numbers')},
+    Optional('checksum'): Or(None, number, error='checksum must be a number')
+})
+
+
+class TrialTimeout(RuntimeError):
+    """Raised when a trial does not finish within its timeout."""
+    pass
+
+
+def module_name(benchmark):
+    """Returns the name of the module for the benchmark file."""
+    return path.splitext(path.basename(benchmark['file']))[0]
+
+
+def launcher_cores(args):
+    """Returns the number of processes started by the launcher arguments of a
+    benchmark, such as ['-np', '4', 'python2'] for mpiexec, otherwise 1.
+    """
+    for i, arg in enumerate(args[:-1]):
+        if arg in ['-np', '-n', '-c']:
+            return int(args[i+1])
+    return 1
+
+
+def option_cores(options):
+    """Returns the number of processes or threads started by a benchmark given
+    by its options, such as ['--procs=4'] for shared_parallel, otherwise 1.
+    """
+    for option in options:
+        name, _, value = option.partition('=')
+        if name in ['--procs', '--threads']:
+            return int(value)
+    return 1
+
+
+def blas_env(threads):
+    """Returns a copy of the environment with the number of BLAS threads set."""
+    env = dict(os.environ)
+    env.update((name, str(threads)) for name in BLAS_THREADS)
+    return env
+
+
+def validate(report):
+    """Returns the validated report of a trial, see message, the execution time,
+    the metrics including the phases, the checksum, and the times of each run.
+    Raises a RuntimeError if the report is invalid.
+    """
+    try:
+        report = message.validate(report)
+    except SchemaError as e:
+        raise RuntimeError('invalid report, %s' % e)
+    metrics = dict(report['metrics'])
+    metrics.update(report['phases'])
+    return report['time'], metrics, report.get('checksum'),\
+        report.get('times') or [report['time']]
+
+
+def read_report(file):
+    """Returns the validated report written by a benchmark to the file, the last
+    line of JSON if there are several. Raises a RuntimeError if the benchmark did
+    not write a valid report.
+    """
+    with open(file, 'r') as fp:
+        lines = [line for line in fp.read().splitlines() if line.strip()]
+    if not lines:
+        raise RuntimeError('no report')
+    try:
+        report = json.loads(lines[-1])
+    except ValueError:
+        raise RuntimeError('report is not valid JSON, %r' % lines[-1][:80])
+    return validate(report)
+
+
+def descendants(pid):
+    """Returns the process ids of the child processes of the process, and their
+    child processes, if pgrep is available.
+    """
+    if PGREP is None:
+        return []
+    children = map(int, Popen([PGREP, '-P', str(pid)], stdout=PIPE).communicate()[0].split())
+    return children + [d for child in children for d in descendants(child)]
+
+
+def kill_tree(pid):
+    """Kills the process, its process group, and all of its descendants, such as
+    the processes started by mpiexec which may be in their own process group.
+    """
+    for target in [pid] + descendants(pid):
+        try:
+            os.kill(target, signal.SIGKILL)
+        except OSError:
+            pass
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+def execute(pargs, env, timeout=None):
+    """Executes the command and returns its output to stderr, the return code, and
+    the resources used by the process and the child processes it waited for, such
+    as the processes started by mpiexec. The command is run in its own process
+    group, which is killed along with any processes it started if it does not
+    finish within the timeout in seconds. Raises a TrialTimeout if killed.
+    """
+    p = Popen(pargs, stdout=PIPE, stderr=PIPE, env=env, preexec_fn=os.setsid)
+
+    # The output to stdout is read but not used, the result is in the report, and
+    # the process is waited for directly as Popen discards the resources used
+    out, err, status = [], [], []
+    threads = [Thread(target=lambda: out.append(p.stdout.read())),
+               Thread(target=lambda: err.append(p.stderr.read())),
+               Thread(target=lambda: status.extend(os.wait4(p.pid, 0)[1:]))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    threads[2].join(timeout)
+    if threads[2].is_alive():
+        kill_tree(p.pid)
+        threads[2].join()
+        raise TrialTimeout('timed out after %g seconds' % timeout)
+    threads[1].join()
+
+    status, usage = status
+    p.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    return err[0], p.returncode, usage
+
+
+def process_metrics(usage, wall):
+    """Returns the metrics of the resources used by a benchmark executed as a
+    separate process, the CPU and wall time and the peak resident memory in
+    megabytes of the largest process.
+    """
+    return {'process_cpu': usage.ru_utime + usage.ru_stime,
+            'process_wall': wall,
+            'process_rss': usage.ru_maxrss / 1024.0}
+
+
+def set_affinity(pid, cpus):
+    """Pins the process, its threads, and its child processes, such as the pool
+    of a benchmark kernel, to the list of CPUs.
+    """
+    if TASKSET is None:
+        return
+    with open(devnull, 'w') as null:
+        for target in [pid] + descendants(pid):
+            call([TASKSET, '-a', '-p', '-c', ','.join(map(str, cpus)), str(target)], stdout=null)
+
+
+class Worker(object):
+    """A long-lived process that imports the benchmark modules once and times the
+    kernels they register repeatedly, avoiding the cost of starting the interpreter
+    and importing NumPy for every trial.
+    """
+
+    def __init__(self, directory, threads=1):
+        """Starts the worker process for the benchmarks in the directory, with the
+        number of threads used by BLAS. The worker is forked, so NumPy must not have
+        been imported, otherwise the number of BLAS threads is already set.
+        """
+        if 'numpy' in sys.modules:
+            raise RuntimeError('NumPy was imported before starting the worker, the number '
+                               'of BLAS threads cannot be set')
+        self.directory = path.abspath(directory)
+        self.threads = threads
+        self.cpus = None
+        self.conn, child = Pipe()
+        self.process = Process(target=self._serve, args=(child,))
+        self.process.start()
+
+    def _serve(self, conn):
+        """The main loop of the worker process, executes each request received."""
+        # The number of BLAS threads must be set before NumPy is imported
+        os.environ.update(blas_env(self.threads))
+        sys.path.insert(0, self.directory)
+        from docopt import docopt
+        import helpers
+
+        while True:
+            request = conn.recv()
+            if request is None:
+                break
+            command, module = request[0], request[1]
+            try:
+                __import__(module)
+                if command == 'kernel':
+                    conn.send((True, module in helpers.kernels))
+                elif command == 'time':
+                    args = helpers.schema.validate(docopt(helpers.usage, argv=request[2]))
+                    runtime = helpers.time_kernel(module, args)
+                    conn.send((True, helpers.message(runtime)))
+            except BaseException as e:
+                conn.send((False, '%s: %s' % (type(e).__name__, e)))
+        conn.close()
+
+        # The process exits without running the exit functions, which the benchmarks
+        # use to release resources such as pools of processes and shared memory
+        atexit._run_exitfuncs()
+
+    def _request(self, *request, **kwargs):
+        """Sends the request to the worker process and returns the response. The
+        worker is killed if it does not respond within the timeout in seconds.
+        """
+        timeout = kwargs.get('timeout')
+        self.conn.send(request)
+        if timeout and not self.conn.poll(timeout):
+            self.kill()
+            raise TrialTimeout('timed out after %g seconds' % timeout)
+        success, response = self.conn.recv()
+        if not success:
+            raise RuntimeError('%s failed in worker, %s' % (request[1], response))
+        return response
+
+    def pin(self, cpus):
+        """Sets the CPU affinity of the worker process to the list of CPUs."""
+        if cpus != self.cpus:
+            set_affinity(self.process.pid, cpus)
+            self.cpus = cpus
+
+    def has_kernel(self, module, timeout=None):
+        """Returns True if the benchmark module registers a kernel."""
+        return self._request('kernel', module, timeout=timeout)
+
+    def time(self, module, argv, timeout=None):
+        """Returns the validated report of the kernel of the module for the
+        arguments, the execution time, metrics, checksum and times, see validate.
+        """
+        return validate(self._request('time', module, argv, timeout=timeout))
+
+    def alive(self):
+        """Returns True if the worker process is running."""
+        return self.process.is_alive()
+
+    def kill(self):
+        """Kills the worker process and the processes it started, such as the pool
+        of a kernel, when a kernel does not finish.
+        """
+        kill_tree(self.process.pid)
+        self.process.join()
+
+    def close(self):
+        """Stops the worker process."""
+        if self.process.is_alive():
+            self.conn.send(None)
+            self.process.join()
+
+
+class Job(object):
+    """A trial of a benchmark submitted to the scheduler."""
+
+    def __init__(self, benchmark, argv):
+        self.benchmark = benchmark
+        self.argv = argv
+        self.cores = benchmark['cores']
+        self.timeout = benchmark.get('timeout')
+        self.duration = None
+        self.metrics = {}
+        self.checksum = None
+        self.times = None
+        self._result = None
+        self._error = None
+        self._done = Event()
+
+    def finish(self, result=None, error=None, metrics=None, checksum=None, times=None):
+        """Records the result, metrics, checksum of the result and times of each
+        run of the trial, or the error if it failed.
+        """
+        self._result, self._error = result, error
+        self.metrics = metrics or {}
+        self.checksum = checksum
+        self.times = times
+        self._done.set()
+
+    def result(self):
+        """Waits for the trial to finish and returns the execution time."""
+        while not self._done.is_set():
+            self._done.wait(0.1)
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class Scheduler(object):
+    """Executes the trials of the benchmarks concurrently, each trial is given
+    exclusive use of the cores it requires, one for serial benchmarks or as many
+    as the processes started by multi-process benchmarks. The trials start in
+    the order they are submitted.
+
+    Benchmarks that register a kernel are timed in-process by a worker pinned to
+    the core of the trial, the remaining benchmarks, or those that need a
+    launcher such as mpiexec, are executed as a separate process pinned to the
+    cores of the trial. The number of threads used by BLAS is set for each
+    benchmark; since it can only be set before NumPy is imported, there is a
+    separate worker for each number of BLAS threads.
+
+    Each trial reports its result as a line of JSON, see helpers.report, written
+    to a file given by the environment for the trials executed as a process. A
+    trial that does not finish within the timeout of the benchmark is killed,
+    along with its worker or the processes started by its launcher.
+    """
+
+    def __init__(self, directory, workers=1, inprocess=True, profile=False):
+        """Initializes the scheduler for the benchmarks in the directory, executing
+        at most the number of workers trials concurrently, on the cores reserved
+        from all of the cores of the machine. Given profile the resources used by
+        the trials executed as a separate process are recorded.
+        """
+        self.directory = directory
+        self.inprocess = inprocess
+        self.profile = profile
+        self.concurrency = workers
+        self.cpus = range(cpu_count())
+        self.workers = {}
+        self.started = None
+        self.finished = None
+        self.sequential = 0.0
+        self._kernels = {}
+        self._free = set(self.cpus)
+        self._running = 0
+        self._cores = Condition()
+        self._lock = Lock()
+        self._threads = []
+        self._closed = False
+        self._queue = Queue()
+        self._dispatcher = Thread(target=self._dispatch)
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def submit(self, benchmark, argv):
+        """Submits a trial of the benchmark with the arguments, returns the job."""
+        if self.started is None:
+            self.started = time()
+        job = Job(benchmark, argv)
+        self._queue.put(job)
+        return job
+
+    def wall_time(self):
+        """Returns the wall time from the first trial submitted until all the trials
+        finished, or until now if the scheduler is still running.
+        """
+        if self.started is None:
+            return 0.0
+        return (time() if self.finished is None else self.finished) - self.started
+
+    def _dispatch(self):
+        """Starts the trials in order as soon as the cores they require are free."""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            if self._closed:
+                job.finish(error=RuntimeError('scheduler closed'))
+                continue
+
+            # A trial that needs more cores than the machine has reserves all of them
+            # and is not pinned, rather than time-sharing fewer cores
+            cpus = self._acquire(min(job.cores, len(self.cpus)))
+            if len(cpus) < job.cores:
+                cpus = None
+            thread = Thread(target=self._execute, args=(job, cpus))
+            thread.daemon = True
+            thread.start()
+            self._threads = [t for t in self._threads if t.is_alive()] + [thread]
+
+        for thread in self._threads:
+            thread.join()
+
+    def _acquire(self, n):
+        """Waits until n cores are free and fewer trials than the workers are
+        running, and reserves the cores.
+        """
+        with self._cores:
+            while len(self._free) < n or self._running >= self.concurrency:
+                self._cores.wait()
+            cpus = sorted(self._free)[:n]
+            self._free.difference_update(cpus)
+            self._running += 1
+            return cpus
+
+    def _release(self, cpus):
+        """Frees the reserved cores, all of them if the trial was not pinned."""
+        with self._cores:
+            self._free.update(self.cpus if cpus is None else cpus)
+            self._running -= 1
+            self._cores.notify_all()
+
+    def _worker(self, cpus, threads):
+        """Returns the worker of the first core reserved with the number of BLAS
+        threads, pinned to the cores, or to all of the cores if not pinned.
+        """
+        cpus = self.cpus if cpus is None else cpus
+        with self._lock:
+            # The worker is replaced if it was killed as a trial timed out
+            if (cpus[0], threads) not in self.workers or\
+                    not self.workers[cpus[0], threads].alive():
+                self.workers[cpus[0], threads] = Worker(self.directory, threads)
+        worker = self.workers[cpus[0], threads]
+        worker.pin(cpus)
+        return worker
+
+    def _has_kernel(self, benchmark, worker, timeout=None):
+        """Returns True if the benchmark is executed in-process, the module is
+        imported by the worker within the timeout to find its kernel. Whether the
+        module registers a kernel is cached, the benchmarks of the test plan using
+        the same module may still differ in whether they are executed in-process.
+        """
+        if not benchmark['inprocess'] or benchmark['args']:
+            return False
+        module = module_name(benchmark)
+        with self._lock:
+            known = module in self._kernels
+        if not known:
+            kernel = worker.has_kernel(module, timeout)
+            with self._lock:
+                self._kernels[module] = kernel
+        return self._kernels[module]
+
+    def _execute(self, job, cpus):
+        """Executes the trial on the reserved cores, the duration of the trial is
+        included in the sequential estimate whether or not it failed or timed out.
+        """
+        start = time()
+        try:
+            benchmark = job.benchmark
+            threads = benchmark['blas_threads']
+            worker = self._worker(cpus, threads) if self.inprocess else None
+            if worker is not None and self._has_kernel(benchmark, worker, job.timeout):
+                result, metrics, checksum, times = worker.time(module_name(benchmark),
+                                                               job.argv, timeout=job.timeout)
+            else:
+                result, metrics, checksum, times = self._process(job, cpus)
+            outcome = dict(result=result, metrics=metrics, checksum=checksum, times=times)
+        except Exception as e:
+            outcome = dict(error=e)
+        try:
+            job.duration = time() - start
+            with self._lock:
+                self.sequential += job.duration
+            job.finish(**outcome)
+        finally:
+            self._release(cpus)
+
+    def _process(self, job, cpus):
+        """Executes the trial as a separate process pinned to the reserved cores,
+        if any, returns the validated report of the trial.
+        """
+        benchmark = job.benchmark
+        pargs = [benchmark['exec']] + benchmark['args'] +\
+                [path.join(self.directory, benchmark['file'])] + job.argv
+        if TASKSET is not None and cpus is not None:
+            pargs = [TASKSET, '-c', ','.join(map(str, cpus))] + pargs
+
+        fd, report = tempfile.mkstemp(prefix='report-', suffix='.json')
+        os.close(fd)
+        try:
+            env = blas_env(benchmark['blas_threads'])
+            env[REPORT] = report
+            start = time()
+            err, returncode, usage = execute(pargs, env, timeout=job.timeout)
+            if returncode != 0:
+                raise RuntimeError('%s failed, %s' % (benchmark['file'], err.strip()))
+            result, metrics, checksum, times = read_report(report)
+        finally:
+            os.remove(report)
+        if self.profile:
+            metrics.update(process_metrics(usage, time() - start))
+        return result, metrics, checksum, times
+
+    def close(self):
+        """Cancels the pending trials, waits for the running trials and stops the
+        workers.
+        """
+        self._closed = True
+        self._queue.put(None)
+        self._dispatcher.join()
+        self.finished = time()
+        for worker in self.workers.values():
+            worker.close()
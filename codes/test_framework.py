@@ -25,39 +25,98 @@
 import yaml
 import csv
 from math import floor
+from itertools import product
 from collections import OrderedDict
 from os import path, popen
-from subprocess import Popen, PIPE
+from multiprocessing import cpu_count
 from docopt import docopt
 from schema import Schema, Or, And, Use, SchemaError
 from clint.textui import puts, progress, colored, indent, columns
 from tabulate import tabulate
+from runner import Scheduler, launcher_cores, option_cores
+from results import ResultStore, plan_hash, trial_times, compare
+
+# The statistics of the execution times included in the summary besides the mean
+STATS = ['median', 'min', 'stddev', 'iqr', 'outliers']
 
 
 usage = """Test Framework
 
 Usage:
-  test_framework.py [-v | --verbose --save=<file>] --benchmarks=<dir> TESTPLAN
+  test_framework.py [options] --benchmarks=<dir> TESTPLAN
+  test_framework.py compare [options] BASELINE CANDIDATE
   test_framework.py -h | --help
 
-  Executes the test plan and evaluates the benchmark in the directory.
+  Executes the test plan and evaluates the benchmark in the directory, or
+  compares the results of two runs of a test plan and exits with an error if
+  the candidate has any regressions.
 
 Arguments:
   TESTPLAN            The test plan YAML document.
+  BASELINE            The results file of the baseline run.
+  CANDIDATE           The results file of the run compared to the baseline.
 
 Options:
   -h, --help          Show this screen and exit.
   -v, --verbose       Increased verbosity, display more information.
   --save=<file>       The file to save the benchmark results to as a CSV.
   --benchmarks=<dir>  The directory containing the benchmarks to execute.
+  --subprocess        Execute every trial as a separate process rather than
+                      timing the benchmark kernels in-process.
+  --workers=<n>       The number of trials executed concurrently, each trial is
+                      pinned to its own cores of the machine [default: 1].
+  --cache=<dir>       The directory of the matrix store, the matrices for each
+                      trial are generated once and shared by the benchmarks.
+  --cache-size=<MB>   The maximum size of the matrix store [default: 1024].
+  --warmup=<n>        The number of untimed runs of a kernel before timing each
+                      trial [default: 1].
+  --repeat=<n>        The maximum number of times a kernel is timed for each
+                      trial, the median is the execution time [default: 10].
+  --ci=<frac>         The target relative half-width of the 95% confidence
+                      interval of the runs of a kernel [default: 0.05].
+  --max-time=<s>      The time after which a kernel is no longer repeated or
+                      warmed up for each trial [default: 1.0].
+  --timeout=<s>       The time after which a trial is killed and recorded as a
+                      failure, unless given by the timeout of the benchmark.
+  --profile           Record the CPU time, memory, hardware counters where they
+                      are available, and GFLOP/s of the kernel of each trial.
+  --results=<file>    The file the result of every trial is appended to as a
+                      line of JSON as soon as the trial finishes.
+  --resume            Skip the trials of the test plan already recorded in the
+                      results file on this host, which are included in the
+                      summary.
+  --threshold=<frac>  The fraction the candidate is slower than the baseline
+                      above which it is a regression [default: 0.05].
+  --alpha=<p>         The significance level of the test that the times of the
+                      trials differ [default: 0.05].
 """
 
 schema = Schema({
-    '--benchmarks': And(path.exists, error='benchmarks directory does not exist.'),
-    'TESTPLAN': And(path.exists, error='Test plan does not exist.'),
+    '--benchmarks': Or(None, And(path.exists,
+                                 error='benchmarks directory does not exist.')),
+    'TESTPLAN': Or(None, And(path.exists, error='Test plan does not exist.')),
+    'compare': Use(bool),
+    'BASELINE': Or(None, And(path.exists, error='Baseline results file does not exist.')),
+    'CANDIDATE': Or(None, And(path.exists, error='Candidate results file does not exist.')),
     '--help': Or(None, Use(bool)),
     '--verbose': Or(None, Use(bool)),
-    '--save': Or(None, Use(str))
+    '--save': Or(None, Use(str)),
+    '--subprocess': Or(None, Use(bool)),
+    '--workers': And(Use(int), lambda n: n > 0, error='--workers=<n> must be a positive integer.'),
+    '--cache': Or(None, Use(str)),
+    '--cache-size': Use(float, error='--cache-size=<MB> must be a floating point value.'),
+    '--warmup': And(Use(int), lambda n: n >= 0, error='--warmup=<n> must be a non-negative integer.'),
+    '--repeat': And(Use(int), lambda n: n > 0, error='--repeat=<n> must be a positive integer.'),
+    '--ci': And(Use(float), lambda x: x > 0, error='--ci=<frac> must be a positive value.'),
+    '--max-time': And(Use(float), lambda x: x >= 0, error='--max-time=<s> must be non-negative.'),
+    '--timeout': Or(None, And(Use(float), lambda x: x > 0,
+                              error='--timeout=<s> must be a positive value.')),
+    '--profile': Or(None, Use(bool)),
+    '--results': Or(None, Use(str)),
+    '--resume': Or(None, Use(bool)),
+    '--threshold': And(Use(float), lambda x: x >= 0,
+                       error='--threshold=<frac> must be non-negative.'),
+    '--alpha': And(Use(float), lambda p: 0 < p < 1, error='--alpha=<p> must be between 0 and 1.')
 })
 
 
@@ -65,11 +124,15 @@ class PrettyPrint(object):
     """Prints the text for the test framework to the screen prettily."""
     _col2 = 30  # Default width for second column
     _tab = 3  # Number of space characters for tab
+    _size = (24, 80)  # Default size of the screen when it is not a terminal
 
     def __init__(self, verbose=False, col1=None, col2=None):
         """Initializes object, optionally can set widths of columns."""
         self.verbose = verbose
-        self.rows, self.cols = map(int, popen('stty size', 'r').read().split())
+        try:
+            self.rows, self.cols = map(int, popen('stty size 2>/dev/null', 'r').read().split())
+        except ValueError:
+            self.rows, self.cols = self._size
         self.col1 = self.cols - self._col2 if col1 is None else col1
         self.col2 = self._col2 if col2 is None else col2
 
@@ -135,14 +198,72 @@ class PrettyPrint(object):
         rpad = self.col1 - len(name) - lpad
         return ' ' * lpad + name + ' ' * rpad
 
-    def table(self, data):
+    def failure(self, name, trial, error):
+        """Displays the error of a trial of the benchmark that failed."""
+        with indent(self._tab * 2):
+            puts(colored.red('trial %d failed, ' % trial) +
+                 columns([error.strip(), self.col1 - self._tab * 2 - 20]))
+
+    def wall_time(self, elapsed, sequential):
+        """Displays the wall time of the test plan compared to executing it sequentially."""
+        puts(colored.cyan('Wall Time: ') + '%0.3f seconds' % elapsed)
+        with indent(4):
+            puts('Sequential estimate of %0.3f seconds, %0.2fx speedup.\n' %
+                 (sequential, sequential / elapsed if elapsed > 0 else 1.0))
+
+    def table(self, data, title='Runtime Results', description=None):
         """Prints a pretty table of the data, where each key is a column, and
            the value is an iterable for the rows of data.
         """
-        puts(colored.cyan('Runtime Results:'))
+        if description is None:
+            description = ('A table of the mean execution time excluding outliers for each\n'
+                           'benchmark, dimensions, and test, and the average of the metrics\n'
+                           'recorded such as the relative error. The median, minimum, standard\n'
+                           'deviation, and interquartile range are included when verbose.\n')
+        puts(colored.cyan(title + ':'))
         with indent(4):
-            puts('A table of the average execution for each benchmark, dimensions, and test.\n')
-        puts(tabulate(data, headers="keys", tablefmt="grid", floatfmt=".3f"))
+            puts(description)
+        # The times are in seconds, with significant digits rather than decimal
+        # places so that the times of the kernels of small matrices are not zero
+        puts(tabulate(data, headers="keys", tablefmt="grid", floatfmt=".4g"))
+
+    def comparison(self, report, regressions, insufficient, threshold, alpha):
+        """Prints the comparison of the median execution times of two runs."""
+        description = ('A table of the median execution time of the baseline and candidate\n'
+                       'runs for each benchmark, dimensions, and test, the speedup of the\n'
+                       'candidate, and the p-value of the Mann-Whitney U test of the trials.\n'
+                       'Changes beyond %g%% significant at the %g level are flagged.\n' %
+                       (threshold * 100, alpha))
+        self.table(report, title='Comparison', description=description)
+        if regressions:
+            puts(colored.red('%d regression(s) found.' % regressions))
+        else:
+            puts(colored.green('No regressions found.'))
+        if insufficient:
+            puts(colored.yellow('%d comparison(s) have too few trials to be significant at the '
+                                '%g level.' % (insufficient, alpha)))
+
+
+def describe(times):
+    """Returns the descriptive statistics of the execution times of the trials, the
+    mean and standard deviation exclude the outliers beyond 1.5 times the
+    interquartile range of the quartiles when there are at least 4 trials.
+    """
+    # NumPy is only imported once the trials are finished, as the number of BLAS
+    # threads of the workers is set by the environment when it is first imported
+    import numpy as np
+    times = np.asarray(times, dtype=np.float64)
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    iqr = q3 - q1
+    kept = times
+    if len(times) >= 4:
+        kept = times[(times >= q1 - 1.5 * iqr) & (times <= q3 + 1.5 * iqr)]
+    return OrderedDict([('mean', kept.mean()),
+                        ('median', median),
+                        ('min', times.min()),
+                        ('stddev', kept.std(ddof=1) if len(kept) > 1 else 0.0),
+                        ('iqr', iqr),
+                        ('outliers', len(times) - len(kept))])
 
 
 class Timing(object):
@@ -152,48 +273,89 @@ class Timing(object):
         self.benchmarks = []
         self.tests = []
         self.dims = []
+        self.threads = OrderedDict()
         self.results = OrderedDict()
+        self.metrics = OrderedDict()
+        self.failures = OrderedDict()
         self.summary = OrderedDict()
 
-    def add(self, benchmark, test, dim, time):
-        """Adds the execution time of a test for the benchmark and dimensions to list."""
-        dim = str(dim)
+    def _register(self, benchmark, test, dim, threads):
+        """Records the benchmark, test and dimensions of a trial."""
+        self.threads[benchmark] = threads
         if benchmark not in self.benchmarks:
             self.benchmarks.append(benchmark)
         if test not in self.tests:
             self.tests.append(test)
         if dim not in self.dims:
             self.dims.append(dim)
-
         if dim not in self.results:
             self.results[dim] = OrderedDict()
         if benchmark not in self.results[dim]:
             self.results[dim][benchmark] = OrderedDict()
+
+    def add(self, benchmark, test, dim, time, threads=1, metrics=None):
+        """Adds the execution time of a test for the benchmark and dimensions to list,
+        along with the metrics recorded by the trial such as the relative error, and
+        records the number of BLAS threads used by the benchmark.
+        """
+        dim = str(dim)
+        self._register(benchmark, test, dim, threads)
         if test not in self.results[dim][benchmark]:
             self.results[dim][benchmark][test] = []
 
         # Add the results for the trials
         self.results[dim][benchmark][test].append(time)
+        for name, value in (metrics or {}).iteritems():
+            self.metrics.setdefault((test, name), OrderedDict()).setdefault(
+                (dim, benchmark), []).append(value)
 
-    def gen_summary(self):
-        """Creates a dictionary summarizing the results of execution times."""
-        self.summary['benchmarks'] = []
-        self.summary['dims'] = []
-        for test in tests:
-            self.summary[test] = []
-
-        # Add the average time for each benchmark, for each dimension, for each test
-        for dim in self.results:
-            for benchmark in self.results[dim]:
-                self.summary['benchmarks'].append(benchmark)
-                self.summary['dims'].append(dim)
-                for test, times in self.results[dim][benchmark].iteritems():
-                    self.summary[test].append(sum(times) / float(len(times)))
+    def fail(self, benchmark, test, dim, threads=1):
+        """Records a trial of the test for the benchmark and dimensions that failed,
+        such as a benchmark that crashed, reported an invalid result or timed out.
+        """
+        dim = str(dim)
+        self._register(benchmark, test, dim, threads)
+        failures = self.failures.setdefault(test, OrderedDict())
+        failures[dim, benchmark] = failures.get((dim, benchmark), 0) + 1
+
+    def gen_summary(self, stats=True):
+        """Creates a dictionary summarizing the results of execution times, the mean
+        of each test excluding the outliers and optionally the other statistics of
+        describe, and the average of each metric recorded for a test.
+        """
+        self.summary = OrderedDict()
+        rows = [(dim, benchmark) for dim in self.results for benchmark in self.results[dim]]
+        self.summary['benchmarks'] = [benchmark for dim, benchmark in rows]
+        self.summary['dims'] = [dim for dim, benchmark in rows]
+        self.summary['blas_threads'] = [self.threads[benchmark] for dim, benchmark in rows]
+
+        # Add the statistics for each benchmark, for each dimension, for each test, the
+        # tests which do not have the dimension are left empty
+        for test in self.tests:
+            described = [describe(self.results[dim][benchmark][test])
+                         if test in self.results[dim][benchmark] else None
+                         for dim, benchmark in rows]
+            self.summary[test] = [d['mean'] if d else None for d in described]
+            if stats:
+                for stat in STATS:
+                    self.summary[test + ' ' + stat] = [d[stat] if d else None for d in described]
+
+        # Add the average of each metric recorded for a test, if any
+        for (test, name), values in self.metrics.iteritems():
+            self.summary[test + ' ' + name] = [
+                sum(values[key]) / len(values[key]) if key in values else None for key in rows]
+
+        # Add the number of trials that failed for each test with any failures
+        for test, failures in self.failures.iteritems():
+            self.summary[test + ' failures'] = [failures.get(key, 0) for key in rows]
 
         return self.summary
 
     def save_summary(self, file):
-        """Saves the summary of the benchmark results to a CSV file."""
+        """Saves the summary of the benchmark results with all of the statistics to a
+        CSV file.
+        """
+        self.gen_summary()
         with open(file, 'wb') as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=self.summary.keys())
             writer.writeheader()
@@ -209,6 +371,18 @@ if __name__ == '__main__':
     except SchemaError as e:
         exit(e)
 
+    # Compare the results of two runs rather than executing a test plan
+    if args['compare']:
+        report, regressions, insufficient = compare(
+            trial_times(args['BASELINE']), trial_times(args['CANDIDATE']),
+            threshold=args['--threshold'], alpha=args['--alpha'])
+        PrettyPrint().comparison(report, regressions, insufficient, args['--threshold'],
+                                 args['--alpha'])
+        exit(1 if regressions else 0)
+
+    if args['--resume'] and not args['--results']:
+        exit('--resume requires the results file given by --results=<file>.')
+
     # Load the test plan
     testplan = None
     try:
@@ -222,48 +396,146 @@ if __name__ == '__main__':
     benchmarks = OrderedDict()
     tests = OrderedDict()
     for benchmark in testplan['benchmarks']:
-        benchmarks[benchmark['name']] = {'description': benchmark['description'],
-                                         'file': benchmark['file'],
-                                         'exec': benchmark['exec'],
-                                         'args': []}
+        entry = {'description': benchmark['description'],
+                 'file': benchmark['file'],
+                 'exec': benchmark['exec'],
+                 'args': [],
+                 'options': [],
+                 'inprocess': True,
+                 'blas_threads': 1}
         if 'args' in benchmark:
-            benchmarks[benchmark['name']]['args'] = benchmark['args']
+            entry['args'] = benchmark['args']
+        entry['timeout'] = args['--timeout']
+        for key in ['options', 'inprocess', 'blas_threads', 'timeout']:
+            if key in benchmark:
+                entry[key] = benchmark[key]
+        # The benchmark is executed for each combination of the values of the
+        # options swept, such as the sample ratio of approximate multiplication,
+        # which replace the options of the benchmark with the same name
+        sweep = benchmark.get('sweep', {})
+        options = sorted(sweep)
+        fixed = [option for option in entry['options'] if option.split('=')[0] not in sweep]
+        for values in product(*[sweep[option] for option in options]):
+            swept = ['%s=%s' % (option, value) for option, value in zip(options, values)]
+            # The number of cores reserved exclusively for each trial of the benchmark,
+            # by default one for each process, thread, and BLAS thread
+            cores = benchmark.get('cores', launcher_cores(entry['args']) *
+                                  option_cores(fixed + swept) * entry['blas_threads'])
+            benchmarks[' '.join([benchmark['name']] + swept)] = dict(entry, options=fixed + swept,
+                                                                     cores=cores)
 
     for test in testplan['tests']:
         tests[test['name']] = {'description': test['description'],
                                'dimensions': test['dimensions'],
                                'dtype': test['dtype'],
-                               'mtype': ''}
-        if 'mtype' in test:
-            tests[test['name']]['mtype'] = test['mtype']
+                               'mtype': '',
+                               'dist': 'uniform',
+                               'sparse': 1.0}
+        for key in ['mtype', 'dist', 'sparse']:
+            if key in test:
+                tests[test['name']][key] = test[key]
 
     pretty = PrettyPrint(verbose=args['--verbose'])
     pretty.title(testplan['name'])
     pretty.summary(testplan)
-
-    # Execute each test in the test plan and store the results
+    for name, benchmark in benchmarks.iteritems():
+        if benchmark['cores'] > cpu_count():
+            puts(colored.red('Warning: %s requires %d cores but the machine has %d, its '
+                             'trials are not pinned.\n' % (name, benchmark['cores'],
+                                                            cpu_count())))
+
+    # Execute each test in the test plan and store the results, the benchmarks
+    # that register a kernel are loaded once and timed in-process. The trials of
+    # each test are submitted at once and executed concurrently by the workers. The
+    # trials that fail are recorded and the remaining trials continue
     timings = Timing()
-    for entry in testplan['testplan']:
-        test, trials = entry['test'], entry['trials']
-        pretty.heading(test)
-        pretty.test_summary(tests[test], trials)
-
-        for dim in tests[test]['dimensions']:
-            puts(colored.cyan(str(dim) + ':'))
-            for name, benchmark in benchmarks.iteritems():
-                for i in progress.bar(range(trials), label=pretty.progress(name), width=10):
-                    # Execute the test, record the execution time
-                    pargs = [benchmark['exec']] + benchmark['args'] +\
-                            [path.join(args['--benchmarks'], benchmark['file']),
-                             '--dtype=' + tests[test]['dtype'],
-                             '--mtype=' + tests[test]['mtype'], str(dim)]
-                    p = Popen(pargs, stdout=PIPE)
-                    output, err = p.communicate()
-                    # Store the results of each trial
-                    timings.add(name, test, dim, float(output))
+    failed = []
+    scheduler = Scheduler(args['--benchmarks'], workers=args['--workers'],
+                          inprocess=not args['--subprocess'], profile=args['--profile'])
+
+    # The trials already recorded for the test plan on this host are skipped when
+    # resuming, and their results are included in the summary
+    plan = plan_hash(testplan)
+    store = ResultStore(args['--results']) if args['--results'] else None
+    recorded = set()
+    if args['--resume']:
+        for record in store.records(plan=plan, host=store.host):
+            # The trials that failed are executed again
+            if record['benchmark'] in benchmarks and record['test'] in tests and\
+                    not record.get('error'):
+                recorded.add((record['benchmark'], record['test'], record['dim'], record['trial']))
+                timings.add(record['benchmark'], record['test'], record['dim'], record['time'],
+                            threads=record['blas_threads'], metrics=record['metrics'])
+    try:
+        for entry in testplan['testplan']:
+            test, trials = entry['test'], entry['trials']
+            pretty.heading(test)
+            pretty.test_summary(tests[test], trials)
+
+            # Each trial is seeded so that every benchmark multiplies the same matrices
+            jobs = OrderedDict()
+            for dim in tests[test]['dimensions']:
+                for name, benchmark in benchmarks.iteritems():
+                    jobs[dim, name] = []
+                    for i in range(trials):
+                        if (name, test, dim, i) in recorded:
+                            continue
+                        bargs = ['--dtype=' + tests[test]['dtype'],
+                                 '--mtype=' + tests[test]['mtype'],
+                                 '--dist=' + tests[test]['dist'],
+                                 '--sparse=' + str(tests[test]['sparse']), '--seed=' + str(i)]
+                        bargs += ['--warmup=%d' % args['--warmup'],
+                                  '--repeat=%d' % args['--repeat'],
+                                  '--ci=%s' % args['--ci'], '--max-time=%s' % args['--max-time']]
+                        bargs += ['--profile'] if args['--profile'] else []
+                        bargs += benchmark['options']
+                        if args['--cache']:
+                            bargs += ['--cache=' + path.abspath(args['--cache']),
+                                      '--cache-size=' + str(args['--cache-size'])]
+                        jobs[dim, name].append(
+                            (i, scheduler.submit(benchmark, bargs + [str(dim)])))
+
+            for dim in tests[test]['dimensions']:
+                puts(colored.cyan(str(dim) + ':'))
+                for name in benchmarks:
+                    if not jobs[dim, name]:
+                        puts(pretty.progress(name) + 'recorded')
+                        continue
+                    errors = []
+                    for i, job in progress.bar(jobs[dim, name], label=pretty.progress(name),
+                                               width=10):
+                        # Store the results of each trial, and append them to the results
+                        try:
+                            runtime, error = job.result(), None
+                            timings.add(name, test, dim, runtime,
+                                        threads=benchmarks[name]['blas_threads'],
+                                        metrics=job.metrics)
+                        except Exception as e:
+                            runtime, error = None, '%s: %s' % (type(e).__name__, e)
+                            timings.fail(name, test, dim, threads=benchmarks[name]['blas_threads'])
+                            errors.append((i, error))
+                        if store is not None:
+                            store.append(plan, name, test, dim, i, runtime, job.metrics,
+                                         dtype=tests[test]['dtype'], mtype=tests[test]['mtype'],
+                                         dist=tests[test]['dist'], sparse=tests[test]['sparse'],
+                                         options=benchmarks[name]['options'],
+                                         blas_threads=benchmarks[name]['blas_threads'],
+                                         warmup=args['--warmup'], repeat=args['--repeat'],
+                                         ci=args['--ci'], max_time=args['--max-time'],
+                                         times=job.times, checksum=job.checksum, error=error)
+                    for i, error in errors:
+                        pretty.failure(name, i, error)
+                    failed += errors
+    finally:
+        scheduler.close()
+        if store is not None:
+            store.close()
 
     # Display the descriptive statistics of the results
     pretty.title(testplan['name'], end='Runtime Summary')
-    pretty.table(timings.gen_summary())
+    pretty.wall_time(scheduler.wall_time(), scheduler.sequential)
+    if failed:
+        puts(colored.red('%d trial(s) failed.\n' % len(failed)))
+    pretty.table(timings.gen_summary(stats=args['--verbose']))
     if args['--save']:
         timings.save_summary(args['--save'])